@@ -0,0 +1,59 @@
+"""Page latency of skip/limit against keyset pagination over a 1M-document collection.
+
+Users are paged by `user_id`, the count is not included in skip/limit timings.
+
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/keyset_pagination.py
+"""
+import asyncio
+import os
+import time
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from telebot_models.models import CollectionGetter
+
+from telebot_views.base import Paginator
+from telebot_views.models import UserModel
+
+DOCUMENTS = 1_000_000
+PAGE_SIZE = 7
+PAGES = (1, 1000, 10_000, 100_000, DOCUMENTS // PAGE_SIZE)
+ROUNDS = 20
+
+
+async def fill(collection) -> None:
+    if await collection.estimated_document_count() == DOCUMENTS:
+        return
+    await collection.drop()
+    for start in range(0, DOCUMENTS, 10_000):
+        await collection.insert_many([{'user_id': i, 'username': f'user{i}'} for i in range(start, start + 10_000)])
+    await collection.create_index([('user_id', 1), ('_id', 1)])
+
+
+async def main() -> None:
+    database = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))['telebot_views_bench']
+    CollectionGetter.get_collection = staticmethod(lambda name: database[name])
+    collection = UserModel.manager.get_collection()
+    await fill(collection)
+    paginator = Paginator(None, PAGE_SIZE)  # type: ignore
+
+    for page in PAGES:
+        skip = (page - 1) * PAGE_SIZE
+        started = time.perf_counter()
+        for _ in range(ROUNDS):
+            await UserModel.manager().find_all(sort=[('user_id', 1), ('_id', 1)], limit=PAGE_SIZE, skip=skip)
+        skip_time = (time.perf_counter() - started) / ROUNDS
+
+        cursor = {}
+        if skip:
+            previous = await collection.find_one({'user_id': skip - 1})
+            cursor = {'after': [previous['user_id'], previous['_id']]}
+        started = time.perf_counter()
+        for _ in range(ROUNDS):
+            await paginator.paginate_keyset(UserModel.manager(), sort_key='user_id', cursor=cursor)
+        keyset_time = (time.perf_counter() - started) / ROUNDS
+
+        print(f'page={page}: skip/limit={skip_time * 1000:.2f}ms keyset={keyset_time * 1000:.2f}ms')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
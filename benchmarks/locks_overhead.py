@@ -0,0 +1,48 @@
+"""Lock overhead per update without contention.
+
+Prints Mongo round trips and latency of `acquire` and `release` for every update.
+
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/locks_overhead.py
+"""
+import asyncio
+import os
+import statistics
+import time
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from telebot_models.models import CollectionGetter
+
+from telebot_views import locks
+
+UPDATES = 1000
+
+
+async def main() -> None:
+    database = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))['telebot_views_bench']
+    CollectionGetter.get_collection = staticmethod(lambda name: database[name])
+    await database[locks.COLL_NAME].drop()
+    await locks.init_locks_collection()
+
+    for confirm_release in (True, False):
+        attempts, acquire_times, release_times = [], [], []
+        for user_id in range(UPDATES):
+            lock = locks.Lock(f'user:{user_id % 10}', 30, confirm_release=confirm_release)
+            result = await lock.acquire()
+            attempts.append(result.attempts)
+            acquire_times.append(result.elapsed)
+            started = time.perf_counter()
+            await lock.release()
+            release_times.append(time.perf_counter() - started)
+        await asyncio.sleep(0.1)  # Let background releases finish
+
+        release_rtt = 1 if confirm_release else 0
+        print(
+            f'confirm_release={confirm_release}: '
+            f'awaited round trips per update={statistics.mean(attempts) + release_rtt:.2f} '
+            f'acquire={statistics.median(acquire_times) * 1000:.2f}ms '
+            f'release={statistics.median(release_times) * 1000:.2f}ms'
+        )
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,57 @@
+"""Wait time for contended `user:<id>` locks.
+
+Every simulated user taps several buttons at once, so updates queue up on the same lock key.
+`handoff` is the time between a release and the next acquisition of the same key.
+
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/locks_wait.py
+"""
+import asyncio
+import os
+import statistics
+import time
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from telebot_models.models import CollectionGetter
+
+from telebot_views import locks
+
+USERS = 50
+UPDATES_PER_USER = 10
+HOLD_TIME = 0.01
+
+
+def percentiles(values: list[float]) -> str:
+    quantiles = statistics.quantiles(values, n=100)
+    return f'p50={quantiles[49] * 1000:.1f}ms p99={quantiles[98] * 1000:.1f}ms'
+
+
+async def main() -> None:
+    database = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))['telebot_views_bench']
+    CollectionGetter.get_collection = staticmethod(lambda name: database[name])
+    await database[locks.COLL_NAME].drop()
+    await locks.init_locks_collection()
+
+    waits: list[float] = []
+    handoffs: list[float] = []
+    released_at: dict[str, float] = {}
+
+    async def update(user_id: int) -> None:
+        key = f'user:{user_id}'
+        start = time.perf_counter()
+        async with locks.Lock(key, 30):
+            acquired = time.perf_counter()
+            waits.append(acquired - start)
+            if key in released_at and released_at[key] > start:
+                handoffs.append(acquired - released_at[key])
+            await asyncio.sleep(HOLD_TIME)
+        released_at[key] = time.perf_counter()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(update(user_id) for user_id in range(USERS) for _ in range(UPDATES_PER_USER)))
+    print(f'{USERS * UPDATES_PER_USER} updates in {time.perf_counter() - started:.2f}s')
+    print(f'wait:    {percentiles(waits)}')
+    print(f'handoff: {percentiles(handoffs)}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,56 @@
+"""Route resolution time with 10, 100 and 500 registered views.
+
+Compares the indexed `Request.get_route` with the previous loop that awaited `resolve` of every route.
+The user is cached in the request, so no Mongo is used.
+
+    python benchmarks/route_dispatch.py
+"""
+import asyncio
+import time
+
+from telebot.types import CallbackQuery
+
+from telebot_views.base import BaseView, Request, Route, RouteResolver
+from telebot_views.models import UserMainState, UserModel, UserStateCb
+
+ROUNDS = 2000
+
+
+def make_request(user: UserModel, data: str) -> Request:
+    user_dict = {'id': user.user_id, 'is_bot': False, 'first_name': 'user'}
+    message = {'message_id': 1, 'from': user_dict, 'chat': {'id': 1, 'type': 'private'}, 'date': 0, 'text': 'menu'}
+    callback = CallbackQuery.de_json(
+        {'id': '1', 'from': user_dict, 'data': data, 'chat_instance': '1', 'message': message}
+    )
+    request = Request(callback=callback)
+    request.__cached_user__ = user
+    return request
+
+
+async def linear_get_route(request: Request) -> Route:
+    for route in RouteResolver.routes_registry.values():
+        if await route.view.route_resolver(request, route).resolve():
+            return route
+    raise RuntimeError('Route not resolved')
+
+
+async def main() -> None:
+    for views in (10, 100, 500):
+        RouteResolver.routes_registry.clear()
+        for i in range(views):
+            RouteResolver.register_route(Route(type(f'View{i}', (BaseView,), {'view_name': f'VIEW_{i}'})))
+
+        callback = UserStateCb(view_name=f'VIEW_{views - 1}')
+        user = UserModel(user_id=1, state=UserMainState(callbacks={callback.id: callback}))
+
+        results = []
+        for name, get_route in (('loop', linear_get_route), ('index', lambda r: r.get_route())):
+            started = time.perf_counter()
+            for _ in range(ROUNDS):
+                await get_route(make_request(user, callback.id))
+            results.append(f'{name}={(time.perf_counter() - started) / ROUNDS * 1e6:.1f}us')
+        print(f'views={views}: {" ".join(results)}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+"""Throughput of sharded update processing with 1, 2, 4 and 8 workers.
+
+Updates are fed to the supervisor directly, no Telegram API calls are made.
+Every handler parses a user state with many callbacks, like `ViewDispatcher` does for every update.
+
+    python benchmarks/sharding.py
+"""
+import time
+from functools import partial
+from multiprocessing import get_context
+from multiprocessing.sharedctypes import Synchronized
+
+from telebot.async_telebot import AsyncTeleBot
+from telebot.types import Message
+
+from telebot_views.models import UserMainState, UserStateCb
+from telebot_views.sharding import ShardedPolling
+
+UPDATES = 20000
+USERS = 1000
+STATE = UserMainState(callbacks={str(i): UserStateCb(view_name='VIEW', page_num=i) for i in range(50)}).dict()
+
+
+def setup(counter: Synchronized) -> AsyncTeleBot:
+    tele_bot = AsyncTeleBot('1:benchmark')
+
+    @tele_bot.message_handler()
+    async def handler(_msg: Message) -> None:
+        UserMainState.parse_obj(STATE)
+        with counter.get_lock():
+            counter.value += 1
+
+    return tele_bot
+
+
+def make_update(update_id: int) -> dict:
+    user = {'id': update_id % USERS + 1, 'is_bot': False, 'first_name': 'user'}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'from': user,
+            'chat': {'id': user['id'], 'type': 'private'},
+            'date': 0,
+            'text': 'text',
+        },
+    }
+
+
+def main() -> None:
+    context = get_context('spawn')
+    updates = [make_update(update_id) for update_id in range(UPDATES)]
+    for workers in (1, 2, 4, 8):
+        counter = context.Value('i', 0)
+        sharded = ShardedPolling('1:benchmark', partial(setup, counter), workers=workers, mp_context=context)
+        sharded.start()
+        time.sleep(2)  # Wait for workers to start
+
+        started = time.perf_counter()
+        for i in range(0, UPDATES, 100):
+            sharded.dispatch(updates[i : i + 100])
+        while counter.value < UPDATES:
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - started
+
+        sharded.stop()
+        print(f'workers={workers}: {UPDATES / elapsed:.0f} updates/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Bytes sent and latency of a user save: full document rewrite against field-level diff.
+
+A user with a big keyboard taps a button, the view renders the same keyboard with a few new buttons,
+as `UserStatesManager` does on every render. Latency is measured only if MONGO_URL is set.
+
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/user_updates.py
+"""
+import asyncio
+import os
+import time
+
+import bson
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from telebot_views.base import UserStatesManager
+from telebot_views.models import UserModel, UserStateCb
+
+CALLBACKS = 200
+NEW_CALLBACKS = 4
+ROUNDS = 200
+
+
+class FakeRequest:
+    def __init__(self, user: UserModel):
+        self.user = user
+
+    async def get_user(self) -> UserModel:
+        return self.user
+
+
+class FakeView:
+    def __init__(self, user: UserModel):
+        self.request = FakeRequest(user)
+
+
+async def render(user: UserModel, tap_num: int) -> None:
+    """Renders the items keyboard plus `NEW_CALLBACKS` buttons that were not shown before"""
+    states = UserStatesManager(FakeView(user))  # type: ignore
+    await states.init()
+    states.next_user_state.view_name = f'VIEW_{tap_num % 2}'
+    for i in range(CALLBACKS):
+        states.add_callback(UserStateCb(view_name='ITEMS_VIEW', params={'item': i}))
+    for i in range(NEW_CALLBACKS):
+        states.add_callback(UserStateCb(view_name='ITEMS_VIEW', params={'new': tap_num, 'item': i}))
+    await states.set()
+    user.keyboard_id = tap_num
+
+
+async def make_user() -> UserModel:
+    user = UserModel(user_id=1, username='user')
+    await render(user, 0)
+    user.mark_persisted()
+    return user
+
+
+async def main() -> None:
+    user = await make_user()
+    await render(user, 1)
+    full = {'$set': user.get_document()}
+    diff = user.get_changes()
+    print(f'callbacks={CALLBACKS}: full rewrite={len(bson.encode(full))} bytes, diff={len(bson.encode(diff))} bytes')
+    print(f'diff paths: {sorted(path for part in diff.values() for path in part)}')
+
+    if 'MONGO_URL' not in os.environ:
+        return
+
+    collection = AsyncIOMotorClient(os.environ['MONGO_URL'])['telebot_views_bench']['users']
+    await collection.delete_many({})
+    document_id = (await collection.insert_one((await make_user()).get_document())).inserted_id
+
+    for name in ('full', 'diff'):
+        user = await make_user()
+        started = time.perf_counter()
+        for i in range(ROUNDS):
+            await render(user, i)
+            update = {'$set': user.get_document()} if name == 'full' else user.get_changes()
+            await collection.update_one({'_id': document_id}, update)
+            user.mark_persisted()
+        print(f'{name}: {(time.perf_counter() - started) / ROUNDS * 1000:.2f}ms per save')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
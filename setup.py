@@ -34,6 +34,5 @@ setuptools.setup(
         "pytelegrambotapi>=4.10.0,<5.0.0",
         "telebot_models>=1.0.0,<2.0.0",
         "pydantic>=1.10.9,<1.20.0",
-        "asyncio_functools>=0.0.1,<1.0.0",
     ],
 )
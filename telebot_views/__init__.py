@@ -1,21 +1,29 @@
 import asyncio
 from contextlib import suppress
+from functools import wraps
 from logging import getLogger
-from typing import Optional, Union
+from typing import Awaitable, Callable, Optional, Union
 
 from telebot.async_telebot import AsyncTeleBot
 from telebot.types import CallbackQuery, InlineQuery, Message
 
 from telebot_views import bot
 from telebot_views.base import Request, Route, RouteResolver
+from telebot_views.cache_backends import CacheBackend
+from telebot_views.callback_codec import CallbackCodec, set_callback_codec
 from telebot_views.dispatcher import ViewDispatcher
 from telebot_views.dummy import DummyView
-from telebot_views.locks import Lock, init_locks_collection
-from telebot_views.models.cache import init_caches_collection
+from telebot_views.events import event_bus
+from telebot_views.locks import Lock, LockMode, init_locks_collection, set_lock_mode
+from telebot_views.models.cache import CacheSettings, MongoCacheBackend, init_caches_collection, set_cache_backend
 from telebot_views.models.links import init_links_collection
 from telebot_views.models.users import init_users_collection
+from telebot_views.outbound import OutboundScheduler, Priority, ScheduledBot, outbound_priority
+from telebot_views.scheduler import UpdateScheduler
+from telebot_views.services.users import user_identity_map
 
 logger = getLogger('telebot_views')
+AnyUpdate = Union[Message, CallbackQuery, InlineQuery]
 
 
 def set_bot(tele_bot: AsyncTeleBot):
@@ -34,15 +42,67 @@ def init(
     reports_bot: Optional[AsyncTeleBot] = bot.reports_bot,
     reports_chat_id: Union[str, int] = bot.reports_chat_id,
     loop: Optional[asyncio.BaseEventLoop] = None,
+    distributed_events: bool = False,
+    lock_mode: LockMode = LockMode.MONGO,
+    nodes: int = 1,
+    update_scheduler: Optional[UpdateScheduler] = None,
+    user_cache_ttl: Optional[float] = None,
+    outbound_scheduler: Optional[OutboundScheduler] = None,
+    concurrent_dispatch: bool = False,
+    callback_secret: Optional[str] = None,
+    distributed_cache_lease: bool = False,
+    cache_backend: Optional[CacheBackend] = None,
 ):
-    # pylint: disable=too-many-arguments
+    # pylint: disable=too-many-arguments,too-many-locals,too-many-statements
     set_bot(tele_bot)
     set_reports_bot(reports_bot, reports_chat_id)
+    if outbound_scheduler is not None:
+        # Handlers are still registered on `tele_bot`, only outgoing requests go through the scheduler
+        bot.bot = ScheduledBot(tele_bot, outbound_scheduler)
+        if reports_bot is not None and reports_bot.token == tele_bot.token:
+            bot.reports_bot = ScheduledBot(reports_bot, outbound_scheduler)
+    set_lock_mode(lock_mode, nodes)
+    ViewDispatcher.concurrent = concurrent_dispatch
+    CacheSettings.distributed_single_flight = distributed_cache_lease
+    if cache_backend is not None:
+        set_cache_backend(cache_backend)
+    # Cached users are only consistent when a user is always handled by the same process,
+    # it is assumed with local locks (e.g. `ShardedPolling` workers), other deployments opt in with `user_cache_ttl`
+    if user_cache_ttl is None:
+        user_cache_ttl = 60 if LockMode(lock_mode) == LockMode.LOCAL else 0
+    user_identity_map.configure(user_cache_ttl if nodes <= 1 else 0)
 
     for route in routes + [Route(DummyView)]:
         RouteResolver.register_route(route)
 
+    if callback_secret:
+        # Buttons are encoded into signed callback data, the user state keeps only callbacks that do not fit
+        codec = CallbackCodec(callback_secret)
+        codec.set_views(RouteResolver.routes_registry)
+        set_callback_codec(codec)
+
+    def scheduled(handler: Callable[[AnyUpdate], Awaitable[None]]) -> Callable[[AnyUpdate], Awaitable[None]]:
+        """Puts updates into the mailbox of the user if the update scheduler is enabled"""
+        if update_scheduler is None:
+            return handler
+
+        @wraps(handler)
+        async def wrapper(update: AnyUpdate) -> None:
+            await update_scheduler.submit(update.from_user.id, lambda: handler(update))
+
+        return wrapper
+
+    async def dispatch(request: Request, user_id: int) -> None:
+        with outbound_priority(Priority.INTERACTIVE):
+            if update_scheduler is not None and nodes <= 1:
+                # Updates of the user are already serialized by the mailbox
+                await ViewDispatcher(request=request).dispatch()
+                return
+            async with Lock(f'user:{user_id}', 30, confirm_release=False):
+                await ViewDispatcher(request=request).dispatch()
+
     @tele_bot.message_handler()
+    @scheduled
     async def message_handler(msg: Message):
         nonlocal skip_non_private
         try:
@@ -51,9 +111,7 @@ def init(
             if msg.from_user.id == tele_bot.token.split(':', 1)[0]:
                 return
 
-            request = Request(msg=msg)
-            async with Lock(f'user:{msg.from_user.id}', 30):
-                await ViewDispatcher(request=request).dispatch()
+            await dispatch(Request(msg=msg), msg.from_user.id)
         except Exception:
             logger.exception(
                 'message_handler error\nuser_id: %s\nusername: %s\nfirst_name: %s\nlast_name: %s',
@@ -66,15 +124,15 @@ def init(
             raise
 
     @tele_bot.callback_query_handler(func=lambda call: True)
+    @scheduled
     async def callback_query(callback: CallbackQuery):
         nonlocal skip_non_private
+        request = Request(callback=callback)
         try:
             if skip_non_private and callback.message.chat.type != 'private':
                 return
 
-            request = Request(callback=callback)
-            async with Lock(f'user:{callback.from_user.id}', 30):
-                await ViewDispatcher(request=request).dispatch()
+            await dispatch(request, callback.from_user.id)
         except Exception:
             logger.exception(
                 'callback_query error\nuser_id: %s\nusername: %s\nfirst_name: %s\nlast_name: %s',
@@ -84,23 +142,28 @@ def init(
                 callback.from_user.last_name,
             )
             with suppress(Exception):
-                await bot.bot.answer_callback_query(
-                    callback.id,
-                    'Что-то пошло не так. Попробуйте еще раз или введите /start',
-                    show_alert=True,
-                )
+                if request.callback_answered:
+                    # In concurrent dispatch the query is answered before rendering, an alert cannot be shown
+                    await bot.bot.send_message(
+                        callback.message.chat.id, 'Что-то пошло не так. Попробуйте еще раз или введите /start'
+                    )
+                else:
+                    await bot.bot.answer_callback_query(
+                        callback.id,
+                        'Что-то пошло не так. Попробуйте еще раз или введите /start',
+                        show_alert=True,
+                    )
             raise
 
     @tele_bot.inline_handler(lambda x: True)
+    @scheduled
     async def inline_query(inline: InlineQuery):
         nonlocal skip_non_private
         try:
             if skip_non_private and inline.chat_type != 'sender':
                 return
 
-            request = Request(inline=inline)
-            async with Lock(f'user:{inline.from_user.id}', 30):
-                await ViewDispatcher(request=request).dispatch()
+            await dispatch(Request(inline=inline), inline.from_user.id)
         except Exception:
             logger.exception(
                 'inline_query error\nuser_id: %s\nusername: %s\nfirst_name: %s\nlast_name: %s',
@@ -116,6 +179,9 @@ def init(
         asyncio.set_event_loop(loop)
 
     loop.create_task(init_users_collection())
-    loop.create_task(init_caches_collection())
+    if isinstance(CacheSettings.backend, MongoCacheBackend):
+        loop.create_task(init_caches_collection())
     loop.create_task(init_links_collection())
     loop.create_task(init_locks_collection())
+    if distributed_events:
+        loop.create_task(event_bus.listen())
@@ -1,5 +1,6 @@
 import asyncio
-from typing import Optional, Type
+from contextlib import suppress
+from typing import Any, AsyncIterator, Awaitable, Callable, Hashable, Optional, Type
 
 from telebot.asyncio_helper import ApiTelegramException
 from telebot.types import (
@@ -15,9 +16,16 @@ from telebot_models.models import BaseModelManager, T
 
 from telebot_views import bot
 from telebot_views.bot import ParseMode
+from telebot_views.callback_codec import CALLBACK_DATA_LIMIT, SIGNED_CALLBACK_PREFIX, CallbackCodecSettings
+from telebot_views.deletion import deletion_queue
+from telebot_views.lru import TTLCache
 from telebot_views.models import UserMainState, UserModel, UserStateCb
-from telebot_views.services.users import get_user_for_message
-from telebot_views.utils import now_utc
+from telebot_views.services.users import load_user_for_message
+from telebot_views.totals import ExactTotal, Total, TotalProvider
+from telebot_views.utils import content_hash, now_utc
+
+STATIC_CALLBACK_PREFIX = '~'
+PAGE_SEPARATOR = '#'
 
 
 class Route:
@@ -35,6 +43,8 @@ class Request:
     Какое-то действие пользователя упакованное в детерминированный объект.
     """
 
+    # pylint: disable=too-many-instance-attributes
+
     def __init__(
         self, msg: Message | None = None, callback: CallbackQuery | None = None, inline: InlineQuery | None = None
     ):
@@ -44,6 +54,9 @@ class Request:
         self.actual_field = msg or callback or inline
         self.__cached_user__: UserModel | None = None
         self.__cached_route__: Route | None = None
+        self.concurrent = False
+        self.callback_answered = False
+        self._side_effects: list[asyncio.Task] = []
 
     @property
     def message(self) -> Message:
@@ -63,16 +76,50 @@ class Request:
             )
         raise ValueError('Unknown type of request')
 
+    def run_concurrently(self, side_effect: Awaitable[None]) -> None:
+        """Runs the side effect in background, the dispatcher waits for it before the request is done"""
+        self._side_effects.append(asyncio.ensure_future(side_effect))
+
+    async def wait_side_effects(self, return_exceptions: bool = False) -> None:
+        side_effects, self._side_effects = self._side_effects, []
+        if side_effects:
+            await asyncio.gather(*side_effects, return_exceptions=return_exceptions)
+
     async def get_user(self) -> UserModel:
         if self.__cached_user__ is None:
-            self.__cached_user__ = await get_user_for_message(self.actual_field, available=True)
+            self.__cached_user__ = await load_user_for_message(self.actual_field, available=True)
         return self.__cached_user__
 
+    async def get_callback(self) -> UserStateCb | None:
+        """Callback of the pressed button.
+
+        Data of a paginated button is `<template callback data>#<page_num>`.
+        """
+        if not self.callback:
+            return None
+        data, separator, page_num = self.callback.data.partition(PAGE_SEPARATOR)
+        cb = await self._get_callback_by_data(data)
+        if not separator or cb is None:
+            return cb
+        if not page_num.isdigit():
+            return None
+        return cb.copy(update={'id': self.callback.data, 'page_num': int(page_num)}, deep=True)
+
+    async def _get_callback_by_data(self, data: str) -> UserStateCb | None:
+        if data.startswith(SIGNED_CALLBACK_PREFIX):
+            codec = CallbackCodecSettings.codec
+            return codec.decode(data, self.callback.from_user.id) if codec is not None else None
+        if data.startswith(STATIC_CALLBACK_PREFIX):
+            cb = RouteResolver.static_callbacks.get(data)
+            return cb.copy(deep=True) if cb is not None else None
+        user = await self.get_user()
+        return user.state.callbacks.get(data)
+
     async def get_route(self) -> Route:
         route: Route
         if self.__cached_route__ is None:
             self.__cached_route__ = RouteResolver.routes_registry.get((await self.get_user()).state.view_name)
-            for route in RouteResolver.routes_registry.values():
+            for route in await RouteResolver.get_candidates(self):
                 if await route.view.route_resolver(self, route).resolve():
                     self.__cached_route__ = route
                     break
@@ -84,9 +131,25 @@ class Request:
 
 
 class RouteResolver:
-    """Route Resolver"""
+    """Route Resolver
+
+    A route is resolved by callbacks of its view, by `commands` and by `deep_link_prefixes`.
+    These keys are indexed on registration, so only matching routes are asked to `resolve`.
+    Routes which are not `is_static` are asked to `resolve` for every request.
+    """
 
     routes_registry: dict[str, Route] = {}
+    commands: tuple[str, ...] = ()
+    deep_link_prefixes: tuple[str, ...] = ()
+
+    routes_order: dict[str, int] = {}
+    commands_index: dict[str, list[str]] = {}
+    deep_link_prefixes_index: list[tuple[str, str]] = []
+    dynamic_routes: list[str] = []
+
+    # Callbacks of static keyboards, shared by all users
+    static_callbacks: dict[str, UserStateCb] = {}
+    static_markups: dict[str, InlineKeyboardMarkup] = {}
 
     def __init__(self, request: Request, route: Route):
         self.request = request
@@ -94,15 +157,84 @@ class RouteResolver:
         self.view = route.view
 
     async def resolve(self) -> bool:
-        user = await self.request.get_user()
-        if self.request.callback and self.request.callback.data in user.state.callbacks:
-            cb = user.state.callbacks.get(self.request.callback.data)
-            return cb is not None and cb.view_name == self.route.value
-        return False
+        text = getattr(self.request.msg, 'text', None) or ''
+        if text in self.commands or text.startswith(self.deep_link_prefixes):
+            return True
+        cb = await self.request.get_callback()
+        return cb is not None and cb.view_name == self.route.value
+
+    @classmethod
+    def is_static(cls, route: Route) -> bool:  # pylint: disable=unused-argument
+        """Returns True if the route resolves only by its callbacks, `commands` or `deep_link_prefixes`"""
+        return cls.resolve is RouteResolver.resolve
 
     @classmethod
     def register_route(cls, route: Route):
         cls.routes_registry[route.view.view_name] = route
+        for row in route.view.static_keyboard:
+            for button in row:
+                RouteResolver.static_callbacks[button.callback.id] = button.callback
+        RouteResolver.build_index()
+
+    @classmethod
+    def get_static_markup(cls, view: 'BaseView', row_width: int) -> InlineKeyboardMarkup:
+        """Markup of the static keyboard of the view, built on the first render when all routes are registered"""
+        markup = RouteResolver.static_markups.get(view.view_name)
+        if markup is None:
+            keyboard = [[button.build(cls.routes_registry) for button in row] for row in view.static_keyboard]
+            markup = RouteResolver.static_markups[view.view_name] = InlineKeyboardMarkup(keyboard, row_width)
+        return markup
+
+    @classmethod
+    def build_index(cls) -> None:
+        RouteResolver.routes_order.clear()
+        RouteResolver.commands_index.clear()
+        RouteResolver.deep_link_prefixes_index.clear()
+        RouteResolver.dynamic_routes.clear()
+        RouteResolver.static_markups.clear()
+        for order, (name, route) in enumerate(RouteResolver.routes_registry.items()):
+            resolver = route.view.route_resolver
+            RouteResolver.routes_order[name] = order
+            for command in resolver.commands:
+                RouteResolver.commands_index.setdefault(command, []).append(name)
+            for prefix in resolver.deep_link_prefixes:
+                RouteResolver.deep_link_prefixes_index.append((prefix, name))
+            if not resolver.is_static(route):
+                RouteResolver.dynamic_routes.append(name)
+
+    @classmethod
+    async def get_candidates(cls, request: Request) -> list[Route]:
+        """Routes that may resolve the request, in order of registration"""
+        names = set(RouteResolver.dynamic_routes)
+        text = getattr(request.msg, 'text', None) or ''
+        names.update(RouteResolver.commands_index.get(text, ()))
+        names.update(name for prefix, name in RouteResolver.deep_link_prefixes_index if text.startswith(prefix))
+        cb = await request.get_callback()
+        if cb is not None and cb.view_name in RouteResolver.routes_registry:
+            names.add(cb.view_name)
+        return [
+            RouteResolver.routes_registry[name] for name in sorted(names, key=RouteResolver.routes_order.__getitem__)
+        ]
+
+
+class StaticButton:
+    """Button of a static keyboard.
+
+    The callback id is derived from the callback content, so it is the same for all users
+    and processes, and the callback is not stored in the user state.
+    The text defaults to `labels[label_index]` of the target view.
+    """
+
+    def __init__(self, view_name: str, label_index: int = 1, text: str = '', **kwargs):
+        self.view_name = view_name
+        self.label_index = label_index
+        self.text = text
+        callback = UserStateCb(view_name=view_name, created_at=None, **kwargs)
+        self.callback = callback.copy(update={'id': STATIC_CALLBACK_PREFIX + content_hash(callback.get_intern_key())})
+
+    def build(self, routes_registry: dict[str, Route]) -> InlineKeyboardButton:
+        text = self.text or routes_registry[self.view_name].view.labels[self.label_index]
+        return InlineKeyboardButton(text, callback_data=self.callback.id)
 
 
 class EmptyMessageSender:
@@ -119,8 +251,14 @@ class KeyboardMessageSender(EmptyMessageSender):
     keyboard_row_width = 5
     parse_mode: ParseMode = ParseMode.NONE
 
+    async def get_markup(self) -> InlineKeyboardMarkup:
+        if self.view.static_keyboard and type(self).get_keyboard is KeyboardMessageSender.get_keyboard:
+            return self.view.route_resolver.get_static_markup(self.view, self.keyboard_row_width)
+        return InlineKeyboardMarkup(keyboard=await self.get_keyboard(), row_width=self.keyboard_row_width)
+
     async def send(self) -> None:
-        markup = InlineKeyboardMarkup(keyboard=await self.get_keyboard(), row_width=self.keyboard_row_width)
+        # pylint: disable=too-many-branches
+        markup = await self.get_markup()
         user = await self.view.request.get_user()
         message = self.view.request.message
         text = await self.get_keyboard_text()
@@ -130,28 +268,42 @@ class KeyboardMessageSender(EmptyMessageSender):
         if user.state.messages_to_delete:
             next_messages_to_delete = set(self.view.user_states.next_user_state.messages_to_delete)
             next_messages_to_delete -= set(user.state.messages_to_delete)
-            await asyncio.gather(
-                *(bot.bot.delete_message(chat_id, message_id) for chat_id, message_id in user.state.messages_to_delete),
-                return_exceptions=True,
-            )
+            deletion_queue.add_many(user.state.messages_to_delete)
             self.view.user_states.next_user_state.messages_to_delete.clear()
             self.view.user_states.next_user_state.messages_to_delete.extend(list(next_messages_to_delete))
             user.state.messages_to_delete.clear()
 
+        text_hash = content_hash(self.parse_mode.value, text)
+        fingerprint = f'{text_hash}:{content_hash(markup.to_json())}'
         if self.view.edit_keyboard and user.keyboard_id is not None:
+            callback = self.view.request.callback
+            if (
+                user.keyboard_fingerprint == fingerprint
+                and callback is not None
+                and callback.message is not None
+                and callback.message.message_id == user.keyboard_id
+            ):
+                # The button was pressed on the keyboard message, so it exists and shows the same content
+                return
             try:
-                await bot.bot.edit_message_text(
-                    text,
-                    message.chat.id,
-                    user.keyboard_id,
-                    reply_markup=markup,
-                    parse_mode=self.parse_mode.value or None,
-                )
+                if user.keyboard_fingerprint and user.keyboard_fingerprint.split(':', 1)[0] == text_hash:
+                    await bot.bot.edit_message_reply_markup(message.chat.id, user.keyboard_id, reply_markup=markup)
+                else:
+                    await bot.bot.edit_message_text(
+                        text,
+                        message.chat.id,
+                        user.keyboard_id,
+                        reply_markup=markup,
+                        parse_mode=self.parse_mode.value or None,
+                    )
             except ApiTelegramException as err:
                 if 'message to edit not found' in err.description:
                     user.keyboard_id = None
+                    user.keyboard_fingerprint = None
                     return await self.send()
-                raise err
+                if 'message is not modified' not in err.description:
+                    raise err
+            user.keyboard_fingerprint = fingerprint
         else:
             if user.keyboard_id:
                 try:
@@ -172,8 +324,13 @@ class KeyboardMessageSender(EmptyMessageSender):
                 parse_mode=self.parse_mode.value or None,
             )
             user.keyboard_id = keyboard.message_id
+            user.keyboard_fingerprint = fingerprint
 
     async def get_keyboard(self) -> list[list[InlineKeyboardButton]]:
+        if self.view.static_keyboard:
+            # A copy, the cached markup is shared by all users
+            markup = self.view.route_resolver.get_static_markup(self.view, self.keyboard_row_width)
+            return [list(row) for row in markup.keyboard]
         raise NotImplementedError
 
     async def get_keyboard_text(self) -> str:
@@ -183,12 +340,82 @@ class KeyboardMessageSender(EmptyMessageSender):
 BaseMessageSender = KeyboardMessageSender  # for backward compatibility
 
 
+class InlineResultsPaginator:
+    """Turns an async generator of inline results into pages with `next_offset` cursors.
+
+    The generator is kept alive between pages, so only the next page is computed.
+    If it is lost (expired, evicted or another process got the query), it is restarted
+    and the results before the offset are skipped. Expired and evicted generators are closed.
+    """
+
+    def __init__(self, page_size: int = 50, ttl: float = 60, maxsize: int = 1024):
+        self.page_size = page_size
+        self._generators: TTLCache[tuple[Hashable, str], AsyncIterator] = TTLCache(maxsize, ttl, on_evict=self._close)
+        self._closing: set[asyncio.Task] = set()
+
+    def _close(self, _key: tuple[Hashable, str], iterator: AsyncIterator) -> None:
+        aclose = getattr(iterator, 'aclose', None)
+        if aclose is not None:
+            task = asyncio.ensure_future(aclose())
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    async def get_page(
+        self, key: Hashable, offset: str, factory: Callable[[], AsyncIterator[InlineQueryResultBase]]
+    ) -> tuple[list[InlineQueryResultBase], str | None]:
+        self._generators.expire()
+        position = int(offset) if offset.isdigit() else 0
+        iterator = self._generators.pop((key, str(position))) if position else None
+        if iterator is None:
+            iterator = factory()
+            with suppress(StopAsyncIteration):
+                for _ in range(position):
+                    await anext(iterator)
+
+        results: list[InlineQueryResultBase] = []
+        with suppress(StopAsyncIteration):
+            while len(results) < self.page_size:
+                results.append(await anext(iterator))
+        if len(results) < self.page_size:
+            return results, None
+
+        next_offset = str(position + len(results))
+        self._generators.set((key, next_offset), iterator)
+        return results, next_offset
+
+
 class InlineQueryResultSender(EmptyMessageSender):
+    """Inline Query Result Sender
+
+    Override `get_results` to return a page of results and the next offset,
+    or `iter_results` to yield all results, which are paginated by `InlineResultsPaginator`.
+    Results are cached in the process for `server_cache_ttl` seconds if it is set.
+    """
+
     cache_time: int = 60
     is_personal: bool = True
+    server_cache_ttl: float = 0
+    server_cache_size: int = 1024
+    results_page_size: int = 50
+
+    _server_cache: TTLCache
+    _paginator: InlineResultsPaginator
+
+    @classmethod
+    def get_server_cache(cls) -> TTLCache[tuple, tuple[list[InlineQueryResultBase], str | None]]:
+        """Cache of the sender class, created on first use"""
+        if '_server_cache' not in cls.__dict__:
+            cls._server_cache = TTLCache(cls.server_cache_size, cls.server_cache_ttl)
+        return cls._server_cache
+
+    @classmethod
+    def get_paginator(cls) -> InlineResultsPaginator:
+        if '_paginator' not in cls.__dict__:
+            cls._paginator = InlineResultsPaginator(cls.results_page_size, max(cls.server_cache_ttl, 60))
+        return cls._paginator
 
     async def send(self) -> None:
-        results, offset = await self.get_results()
+        results, offset = await self.get_cached_results()
         await bot.bot.answer_inline_query(
             self.view.request.inline.id,
             results,
@@ -197,8 +424,29 @@ class InlineQueryResultSender(EmptyMessageSender):
             next_offset=offset,
         )
 
+    def get_cache_key(self) -> tuple:
+        inline = self.view.request.inline
+        user_id = inline.from_user.id if self.is_personal else None
+        return self.view.view_name, inline.query, inline.offset, user_id
+
+    async def get_cached_results(self) -> tuple[list[InlineQueryResultBase], str | None]:
+        if not self.server_cache_ttl:
+            return await self.get_results()
+        key = self.get_cache_key()
+        cached = self.get_server_cache().get(key)
+        if cached is None:
+            cached = await self.get_results()
+            self.get_server_cache().set(key, cached)
+        return cached
+
     async def get_results(self) -> tuple[list[InlineQueryResultBase], str | None]:
+        inline = self.view.request.inline
+        key = self.view.view_name, inline.query, inline.from_user.id
+        return await self.get_paginator().get_page(key, inline.offset, self.iter_results)
+
+    async def iter_results(self) -> AsyncIterator[InlineQueryResultBase]:
         raise NotImplementedError
+        yield  # pylint: disable=unreachable
 
 
 class ButtonsBuilder:
@@ -210,9 +458,25 @@ class ButtonsBuilder:
     async def btn(self, text: str, callback_data: UserStateCb) -> InlineKeyboardButton:
         user = await self.view.request.get_user()
         assert isinstance(user.state, UserMainState)
-        self.view.user_states.add_callback(callback_data)
+        if CallbackCodecSettings.codec is not None:
+            data = CallbackCodecSettings.codec.encode(callback_data, user.user_id)
+            if data is not None:
+                return InlineKeyboardButton(text, callback_data=data)
+        callback_data = self.view.user_states.add_callback(callback_data) or callback_data
         return InlineKeyboardButton(text, callback_data=callback_data.id)
 
+    async def template(self, callback_data: UserStateCb, suffix_size: int) -> str:
+        """Data of a template callback, buttons append `#<value>` of up to `suffix_size` chars to it.
+
+        One callback is stored for all the buttons, if it is not encoded into the data.
+        """
+        codec = CallbackCodecSettings.codec
+        if codec is not None:
+            data = codec.encode(callback_data, (await self.view.request.get_user()).user_id)
+            if data is not None and len(data) + len(PAGE_SEPARATOR) + suffix_size <= CALLBACK_DATA_LIMIT:
+                return data
+        return (self.view.user_states.add_callback(callback_data) or callback_data).id
+
     async def view_btn(self, route: Route, index: int, **kwargs) -> InlineKeyboardButton:
         label = route.view.labels[index]
         callback_data = UserStateCb(view_name=route.view.view_name, **kwargs)
@@ -234,6 +498,7 @@ class UserStatesManager:
 
     async def set(self) -> None:
         user = await self.view.request.get_user()
+        self.next_user_state.prune_callbacks()
         user.state = self.next_user_state
 
     def add_message_to_delete(self, chat_id: int, message_id: int, only_next: bool = True):
@@ -241,9 +506,26 @@ class UserStatesManager:
         if not only_next:
             self.actual_user_state.add_message_to_delete(chat_id, message_id)
 
-    def add_callback(self, callback_data: UserStateCb):
-        self.next_user_state.callbacks[callback_data.id] = callback_data
-        self.actual_user_state.callbacks[callback_data.id] = callback_data
+    def add_callback(self, callback_data: UserStateCb) -> UserStateCb:
+        """Adds the callback to both states. Returns the callback with the id to use in a button.
+
+        A callback identical to one of the actual state keeps its id,
+        so the same keyboard renders with the same callback data.
+        Its age is renewed only after half of `callbacks_max_age`, so a re-rendered keyboard stays unchanged.
+        """
+        existing = self.actual_user_state.get_interned_callback(callback_data)
+        if existing is not None:
+            max_age = self.actual_user_state.callbacks_max_age
+            if (
+                max_age is not None
+                and existing.created_at is not None
+                and existing.created_at < now_utc() - max_age / 2
+            ):
+                existing.created_at = now_utc()
+            callback_data = existing
+        callback_data = self.next_user_state.add_callback(callback_data)
+        self.actual_user_state.add_callback(callback_data)
+        return callback_data
 
 
 class CallbacksManager:
@@ -255,9 +537,9 @@ class CallbacksManager:
         self.show_alert = True
 
     async def answer_callback(self) -> None:
-        if self.view.request.callback:
-            user = await self.view.request.get_user()
-            cb = user.state.callbacks.get(self.view.request.callback.data)
+        if self.view.request.callback and not self.view.request.callback_answered:
+            self.view.request.callback_answered = True
+            cb = await self.view.request.get_callback()
             if cb is None:
                 self.callback_answer = 'Keyboard Invalid'
             try:
@@ -300,6 +582,12 @@ class BaseView:
     ignore_income_messages = False
     ignore_income_callbacks = False
     ignore_inline_query = True
+    # In concurrent dispatch the callback is answered before rendering,
+    # set to True if the view sets `callback_answer` while rendering
+    late_callback_answer = False
+    total_provider: TotalProvider = ExactTotal()
+    # Keyboard shared by all users, rendered without per-user callbacks
+    static_keyboard: list[list[StaticButton]] = []
     page_size = 7
     labels = [
         'Базовый вид',
@@ -347,11 +635,14 @@ class BaseView:
             if redirect_view is not None:
                 return await redirect_view.dispatch()
 
-            await self.callbacks.answer_callback()
+            if self.request.concurrent:
+                self.request.run_concurrently(self.callbacks.answer_callback())
+            else:
+                await self.callbacks.answer_callback()
             await self.user_states.set()
 
         if self.request.msg and self.delete_income_messages:
-            await bot.bot.delete_message(self.request.message.chat.id, self.request.message.message_id)
+            deletion_queue.add(self.request.message.chat.id, self.request.message.message_id)
 
         return self.route_resolver.routes_registry[self.view_name]
 
@@ -365,12 +656,26 @@ class Paginator:
     def __init__(self, view: BaseView, page_size: int):
         self.view = view
         self.page_size = page_size
+        # State of the last `paginate_keyset` page
+        self.has_prev = False
+        self.has_next = False
+        self.first_key: Any = None
+        self.last_key: Any = None
 
     async def paginate(
-        self, manager: BaseModelManager[T], page_num: int, total: int | None = None, **kwargs
+        self,
+        manager: BaseModelManager[T],
+        page_num: int,
+        total: int | None = None,
+        filters: dict[str, Any] | None = None,
+        **kwargs,
     ) -> list[T]:
+        """Page of documents. If `total` is not given, it is taken from `total_provider` of the view,
+        `filters` are the filters of the manager to count with.
+        """
         if total is None:
-            total = await manager.count()
+            offset = (max(int(page_num or 1), 1) - 1) * self.page_size
+            total = await self.get_total(manager, filters, offset)
 
         page_num = self.validate_page_num(total, page_num)
         kwargs.setdefault('sort', [('_id', 1)])
@@ -381,17 +686,109 @@ class Paginator:
             skip=(page_num - 1) * self.page_size,
         )
 
+    async def get_total(
+        self, manager: BaseModelManager[T], filters: dict[str, Any] | None = None, offset: int = 0
+    ) -> Total:
+        return await self.view.total_provider.get_total(manager, filters, offset)
+
+    def get_cursor(self) -> dict[str, Any]:
+        """Keyset cursor of the pressed page button"""
+        return self.view.callback.params.get('cursor') or {}
+
+    async def paginate_keyset(
+        self,
+        manager: BaseModelManager[T],
+        sort_key: str = '_id',
+        direction: int = 1,
+        cursor: dict[str, Any] | None = None,
+        **kwargs,
+    ) -> list[T]:
+        """Pages on the sort key instead of skipping documents and counting them.
+
+        The cursor is `{'after': key}`, `{'before': key}`, `{'last': True}` or empty for the first page.
+        A non-unique `sort_key` is paired with `_id`, the key is `[value, _id]` then.
+        `get_keyset_pagination` builds buttons with cursors for the page.
+        """
+        # pylint: disable=too-many-arguments
+        cursor = self.get_cursor() if cursor is None else cursor
+        keys = [sort_key] if sort_key == '_id' else [sort_key, '_id']
+        backward = 'before' in cursor or bool(cursor.get('last'))
+        order = -direction if backward else direction
+        boundary = cursor.get('after', cursor.get('before'))
+        if boundary is not None:
+            manager = manager.filter(self.get_keyset_filter(keys, boundary, '$gt' if order == 1 else '$lt'))
+
+        kwargs.pop('sort', None)
+        items = await manager.find_all(**kwargs, sort=[(key, order) for key in keys], limit=self.page_size + 1)
+        more = len(items) > self.page_size
+        items = items[: self.page_size]
+        if backward:
+            items.reverse()
+
+        self.has_prev = more if backward else boundary is not None
+        self.has_next = boundary is not None if backward else more
+        self.first_key = self.get_keyset_key(items[0], keys) if items else None
+        self.last_key = self.get_keyset_key(items[-1], keys) if items else None
+        return items
+
+    @staticmethod
+    def get_keyset_filter(keys: list[str], boundary: Any, operator: str) -> dict[str, Any]:
+        if len(keys) == 1:
+            return {keys[0]: {operator: boundary}}
+        value, _id = boundary
+        return {'$or': [{keys[0]: {operator: value}}, {keys[0]: value, '_id': {operator: _id}}]}
+
+    @staticmethod
+    def get_keyset_key(item: Any, keys: list[str]) -> Any:
+        values = [item.id if key == '_id' else getattr(item, key) for key in keys]
+        return values[0] if len(values) == 1 else values
+
+    async def get_keyset_pagination(
+        self, page_num: int | None, total: int | None = None, **kwargs
+    ) -> list[list[InlineKeyboardButton]]:
+        """Buttons for the last `paginate_keyset` page: first, previous, current, next and last.
+
+        Page numbers are shown on the first and last buttons if `total` is known.
+        """
+        r = self.view.route_resolver.routes_registry
+        route = r[self.view.view_name]
+        pages = self.get_pages(total) if total is not None else None
+        params = kwargs.pop('params', {})
+
+        async def page_btn(label: str, num: int | None, cursor: dict[str, Any]) -> InlineKeyboardButton:
+            callback = UserStateCb(view_name=route.value, page_num=num, params={**params, 'cursor': cursor}, **kwargs)
+            return await self.view.buttons.btn(label, callback)
+
+        row = []
+        if self.has_prev:
+            row.append(await page_btn('1' if pages else '<<', 1, {}))
+            row.append(await page_btn('<', page_num and page_num - 1, {'before': self.first_key}))
+        if self.has_prev or self.has_next:
+            row.append(await page_btn(f'-{page_num or "?"}-', page_num, self.get_cursor()))
+        if self.has_next:
+            row.append(await page_btn('>', page_num and page_num + 1, {'after': self.last_key}))
+            row.append(await page_btn(str(pages) if pages else '>>', pages, {'last': True}))
+        return [row] if row else []
+
     async def get_pagination(self, total: int, page_num: int, **kwargs) -> list[list[InlineKeyboardButton]]:
         r = self.view.route_resolver.routes_registry
         route = r[self.view.view_name]
 
         pages = self.get_pages(total)
         page_num = self.validate_page_num(total, page_num)
+        capped = getattr(total, 'capped', False)
+        template = await self.view.buttons.template(
+            UserStateCb(view_name=route.value, page_num=None, **kwargs), len(str(pages))
+        )
+
+        def page_btn(label: str, num: int) -> InlineKeyboardButton:
+            return InlineKeyboardButton(label, callback_data=f'{template}{PAGE_SEPARATOR}{num}')
 
         def page_label(num: int):
+            label = f'{num}+' if capped and num == pages else str(num)
             if num == page_num:
-                return f'-{num}-'
-            return str(num)
+                return f'-{label}-'
+            return label
 
         pages_info = [[]]
         if pages <= 1:
@@ -399,8 +796,7 @@ class Paginator:
 
         elif 1 < pages < 7:
             for i in range(pages):
-                callback = UserStateCb(view_name=route.value, page_num=i + 1, **kwargs)
-                pages_info[0].append(await self.view.buttons.btn(page_label(i + 1), callback))
+                pages_info[0].append(page_btn(page_label(i + 1), i + 1))
 
         elif pages >= 7 and page_num < 5:
             #   .
@@ -413,12 +809,10 @@ class Paginator:
             # ['1', '2', '3', '4', '5', '>>', '99']
 
             for i in range(5):
-                callback = UserStateCb(view_name=route.value, page_num=i + 1, **kwargs)
-                pages_info[0].append(await self.view.buttons.btn(page_label(i + 1), callback))
+                pages_info[0].append(page_btn(page_label(i + 1), i + 1))
 
-            callback = UserStateCb(view_name=route.value, page_num=pages, **kwargs)
-            pages_info[0].append(await self.view.buttons.btn('>>', callback))
-            pages_info[0].append(await self.view.buttons.btn(page_label(pages), callback))
+            pages_info[0].append(page_btn('>>', pages))
+            pages_info[0].append(page_btn(page_label(pages), pages))
 
         elif pages >= 7 and page_num > pages - 4:
             #                    .
@@ -430,35 +824,24 @@ class Paginator:
             #                                      .
             # ['1', '<<', '95', '96', '97', '98', '99']
 
-            callback = UserStateCb(view_name=route.value, page_num=1, **kwargs)
-            pages_info[0].append(await self.view.buttons.btn(page_label(1), callback))
-            pages_info[0].append(await self.view.buttons.btn('<<', callback))
+            pages_info[0].append(page_btn(page_label(1), 1))
+            pages_info[0].append(page_btn('<<', 1))
 
             for i in range(pages - 5, pages):
-                callback = UserStateCb(view_name=route.value, page_num=i + 1, **kwargs)
-                pages_info[0].append(await self.view.buttons.btn(page_label(i + 1), callback))
+                pages_info[0].append(page_btn(page_label(i + 1), i + 1))
         elif pages >= 7:
             #                   .
             # ['1', '<<', '6', '7', '8', '>>', '99']
             #                    .
             # ['1', '<<', '94', '95', '96', '>>', '99']
 
-            callback = UserStateCb(view_name=route.value, page_num=1, **kwargs)
-            pages_info[0].append(await self.view.buttons.btn(page_label(1), callback))
-            pages_info[0].append(await self.view.buttons.btn('<<', callback))
-
-            callback = UserStateCb(view_name=route.value, page_num=page_num - 1, **kwargs)
-            pages_info[0].append(await self.view.buttons.btn(page_label(page_num - 1), callback))
-
-            callback = UserStateCb(view_name=route.value, page_num=page_num, **kwargs)
-            pages_info[0].append(await self.view.buttons.btn(page_label(page_num), callback))
-
-            callback = UserStateCb(view_name=route.value, page_num=page_num + 1, **kwargs)
-            pages_info[0].append(await self.view.buttons.btn(page_label(page_num + 1), callback))
-
-            callback = UserStateCb(view_name=route.value, page_num=pages, **kwargs)
-            pages_info[0].append(await self.view.buttons.btn('>>', callback))
-            pages_info[0].append(await self.view.buttons.btn(page_label(pages), callback))
+            pages_info[0].append(page_btn(page_label(1), 1))
+            pages_info[0].append(page_btn('<<', 1))
+            pages_info[0].append(page_btn(page_label(page_num - 1), page_num - 1))
+            pages_info[0].append(page_btn(page_label(page_num), page_num))
+            pages_info[0].append(page_btn(page_label(page_num + 1), page_num + 1))
+            pages_info[0].append(page_btn('>>', pages))
+            pages_info[0].append(page_btn(page_label(pages), pages))
 
         return pages_info
 
@@ -0,0 +1,182 @@
+import fcntl
+import mmap
+import os
+import stat
+import struct
+import tempfile
+import zlib
+from datetime import datetime, timezone
+from typing import Iterable, NamedTuple, Optional
+
+import bson
+from bson.codec_options import CodecOptions
+
+from telebot_views.lru import TTLCache
+from telebot_views.utils import now_utc
+
+
+class CacheEntry(NamedTuple):
+    """Cached data, stale after `fresh_until` and removed after `valid_until`"""
+
+    data: dict
+    fresh_until: datetime | None = None
+    valid_until: datetime | None = None
+
+    def is_stale(self) -> bool:
+        return self.fresh_until is not None and self.fresh_until <= now_utc()
+
+    def ttl(self) -> float:
+        """Seconds until the entry is removed"""
+        if self.valid_until is None:
+            return float('inf')
+        return (self.valid_until - now_utc()).total_seconds()
+
+
+class CacheBackend:
+    """Storage of `with_cache`.
+
+    Entries with `local_tier` backends are also kept in the in-process cache of every process.
+    """
+
+    local_tier: bool = True
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        raise NotImplementedError
+
+    async def set(self, key: str, entry: CacheEntry) -> None:
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    async def get_many(self, keys: Iterable[str]) -> dict[str, CacheEntry]:
+        result = {}
+        for key in keys:
+            entry = await self.get(key)
+            if entry is not None:
+                result[key] = entry
+        return result
+
+    async def set_many(self, entries: dict[str, CacheEntry]) -> None:
+        for key, entry in entries.items():
+            await self.set(key, entry)
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Cache of the current process only"""
+
+    local_tier = False
+
+    def __init__(self, maxsize: int = 10000):
+        self._cache: TTLCache[str, CacheEntry] = TTLCache(maxsize)
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        return self._cache.get(key)
+
+    async def set(self, key: str, entry: CacheEntry) -> None:
+        if entry.ttl() > 0:
+            self._cache.set(key, entry, ttl=entry.ttl())
+
+    async def delete(self, key: str) -> None:
+        self._cache.pop(key)
+
+
+# seq, crc32 of payload, expiration timestamp, payload length
+SLOT_HEADER = struct.Struct('<IIdI')
+SHM_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+BSON_OPTIONS = CodecOptions(tz_aware=True, tzinfo=timezone.utc)
+
+
+class SharedMemoryCacheBackend(CacheBackend):
+    """Cache shared by processes of the same host through a memory mapped file.
+
+    The file is a table of `slots` fixed size slots, a key is stored in the slot `crc32(key) % slots`,
+    so a colliding key replaces the previous one. Values larger than a slot are not cached.
+    Reads are lock-free: a writer makes the slot sequence number odd while it writes,
+    a reader retries if the number changed and checks the payload crc32.
+    Writers of the same slot are serialized by a byte range lock of the file.
+
+    Entries are stored as BSON. The file must be owned by the user of the process
+    and be accessible only by it, otherwise it is refused.
+    """
+
+    local_tier = False
+
+    def __init__(
+        self,
+        path: str = os.path.join(SHM_DIR, 'telebot_views_cache'),
+        slots: int = 4096,
+        slot_size: int = 4096,
+    ):
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self._fd: Optional[int] = None
+        self._mmap: Optional[mmap.mmap] = None
+
+    def _open(self) -> mmap.mmap:
+        # Opened lazily, so every forked worker gets its own mapping of the same file
+        if self._mmap is None:
+            size = self.slots * self.slot_size
+            descriptor = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+            info = os.fstat(descriptor)
+            if info.st_uid != os.getuid() or stat.S_IMODE(info.st_mode) & 0o077 or not stat.S_ISREG(info.st_mode):
+                os.close(descriptor)
+                raise PermissionError(f'Cache file {self.path} must be a file of the current user with mode 0600')
+            if info.st_size < size:
+                os.ftruncate(descriptor, size)
+            self._fd = descriptor
+            self._mmap = mmap.mmap(descriptor, size)
+        return self._mmap
+
+    def _offset(self, key: str) -> int:
+        return zlib.crc32(key.encode()) % self.slots * self.slot_size
+
+    def read(self, key: str) -> Optional[CacheEntry]:
+        memory, offset = self._open(), self._offset(key)
+        for _ in range(3):
+            seq, crc, expires, length = SLOT_HEADER.unpack_from(memory, offset)
+            payload = memory[offset + SLOT_HEADER.size : offset + SLOT_HEADER.size + length]
+            if not seq & 1 and SLOT_HEADER.unpack_from(memory, offset)[0] == seq:
+                break
+        else:
+            return None  # The slot is being rewritten
+
+        if not length or expires <= now_utc().timestamp() or zlib.crc32(payload) != crc:
+            return None
+        try:
+            document = bson.decode(payload, BSON_OPTIONS)
+        except Exception:  # pylint: disable=broad-except
+            return None
+        if document.get('key') != key:
+            return None
+        return CacheEntry(document['data'], document['fresh_until'], document['valid_until'])
+
+    def write(self, key: str, entry: Optional[CacheEntry]) -> None:
+        """Writes the entry to the slot of the key, or clears the slot if the entry is None"""
+        payload = b'' if entry is None else bson.encode({'key': key, **entry._asdict()})
+        if SLOT_HEADER.size + len(payload) > self.slot_size:
+            payload = b''  # Does not fit, the previous value of the slot must not be served anymore
+        memory, offset = self._open(), self._offset(key)
+        expires = entry.valid_until.timestamp() if entry and entry.valid_until else float('inf')
+
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, self.slot_size, offset)
+        try:
+            if entry is None and self.read(key) is None:
+                return  # The slot is taken by another key
+            seq = SLOT_HEADER.unpack_from(memory, offset)[0]
+            struct.pack_into('<I', memory, offset, (seq + 1) & 0xFFFFFFFF)
+            memory[offset + SLOT_HEADER.size : offset + SLOT_HEADER.size + len(payload)] = payload
+            SLOT_HEADER.pack_into(memory, offset, (seq + 1) & 0xFFFFFFFF, zlib.crc32(payload), expires, len(payload))
+            struct.pack_into('<I', memory, offset, (seq + 2) & 0xFFFFFFFF)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, self.slot_size, offset)
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        return self.read(key)
+
+    async def set(self, key: str, entry: CacheEntry) -> None:
+        self.write(key, entry)
+
+    async def delete(self, key: str) -> None:
+        self.write(key, None)
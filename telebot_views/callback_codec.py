@@ -0,0 +1,120 @@
+import base64
+import hashlib
+import hmac
+import json
+from logging import getLogger
+from typing import Iterable, Optional
+
+from telebot_views.models import UserStateCb
+
+logger = getLogger(__name__)
+
+SIGNED_CALLBACK_PREFIX = '!'
+CALLBACK_DATA_LIMIT = 64
+
+
+def _write_varint(number: int) -> bytes:
+    result = bytearray()
+    while True:
+        number, rest = number >> 7, number & 0x7F
+        if not number:
+            result.append(rest)
+            return bytes(result)
+        result.append(rest | 0x80)
+
+
+def _read_varint(data: bytes, pos: int) -> tuple[int, int]:
+    number = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        number |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return number, pos
+        shift += 7
+
+
+class CallbackCodec:
+    """Stateless callback data signed with HMAC.
+
+    `!` + base64url of `tag | view index | page_num + 1 | params flags | json of params`.
+    Views are stored as indexes in the sorted table of registered view names.
+    The digest of the table is mixed into the signing key, so buttons of another set of views are invalid.
+    The tag also signs the id of the user, a button forwarded to another user is invalid for them.
+    Callbacks which do not fit into 64 bytes are stored in the user state as usual.
+    """
+
+    def __init__(self, secret: str | bytes, tag_size: int = 6):
+        self.secret = secret.encode() if isinstance(secret, str) else secret
+        self.tag_size = tag_size
+        self._views: list[str] = []
+        self._views_index: dict[str, int] = {}
+        self._key = self.secret
+
+    def set_views(self, view_names: Iterable[str]) -> None:
+        self._views = sorted(view_names)
+        self._views_index = {name: i for i, name in enumerate(self._views)}
+        table_digest = hashlib.sha256('\0'.join(self._views).encode()).digest()
+        self._key = hmac.new(self.secret, table_digest, hashlib.sha256).digest()
+
+    def _sign(self, body: bytes, user_id: int) -> bytes:
+        message = str(user_id).encode() + b'\0' + body
+        return hmac.new(self._key, message, hashlib.sha256).digest()[: self.tag_size]
+
+    def encode(self, callback: UserStateCb, user_id: int) -> Optional[str]:
+        """Returns callback data for the user or None if the callback does not fit"""
+        view_index = self._views_index.get(callback.view_name)
+        if view_index is None or (callback.page_num is not None and callback.page_num < 0):
+            # Negative page numbers cannot be stored as varints, such callbacks are kept in the user state
+            return None
+        page_num = 0 if callback.page_num is None else callback.page_num + 1
+        body = _write_varint(view_index) + _write_varint(page_num)
+        # Params are stored as a json of only the non-empty dicts, the flag tells which ones
+        dicts = [d for d in (callback.view_params, callback.params) if d]
+        body += bytes([bool(callback.view_params) | bool(callback.params) << 1])
+        if dicts:
+            try:
+                body += json.dumps(dicts[0] if len(dicts) == 1 else dicts, separators=(',', ':')).encode()
+            except TypeError:
+                return None
+        data = SIGNED_CALLBACK_PREFIX + base64.urlsafe_b64encode(self._sign(body, user_id) + body).rstrip(b'=').decode()
+        return data if len(data) <= CALLBACK_DATA_LIMIT else None
+
+    def decode(self, data: str, user_id: int) -> Optional[UserStateCb]:
+        """Returns the callback or None if the data is invalid or signed for another user"""
+        try:
+            encoded = data[len(SIGNED_CALLBACK_PREFIX) :]
+            raw = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+            tag, body = raw[: self.tag_size], raw[self.tag_size :]
+            if not hmac.compare_digest(tag, self._sign(body, user_id)):
+                return None
+            view_index, pos = _read_varint(body, 0)
+            page_num, pos = _read_varint(body, pos)
+            flags, pos = body[pos], pos + 1
+            dicts = json.loads(body[pos:]) if flags else None
+            if flags == 3:
+                view_params, params = dicts
+            else:
+                view_params = dicts if flags == 1 else {}
+                params = dicts if flags == 2 else {}
+            return UserStateCb(
+                id=data,
+                view_name=self._views[view_index],
+                page_num=page_num - 1 if page_num else None,
+                created_at=None,
+                view_params=view_params,
+                params=params,
+            )
+        except (ValueError, IndexError):
+            logger.debug('Invalid callback data %s', data, exc_info=True)
+            return None
+
+
+class CallbackCodecSettings:
+    """Settings for callback data"""
+
+    codec: Optional[CallbackCodec] = None
+
+
+def set_callback_codec(codec: Optional[CallbackCodec]) -> None:
+    CallbackCodecSettings.codec = codec
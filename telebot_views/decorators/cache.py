@@ -0,0 +1,113 @@
+import asyncio
+from functools import wraps
+from logging import getLogger
+from typing import Any, Awaitable, Callable, Generic, Hashable, NamedTuple, TypeVar
+
+from telebot_views.decorators.context import AsyncFuncType
+from telebot_views.lru import TTLCache
+
+logger = getLogger(__name__)
+
+R = TypeVar('R')
+
+
+class SingleFlight(Generic[R]):
+    """Concurrent calls with the same key wait for the single in-flight call"""
+
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, asyncio.Future] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable[R]]) -> tuple[R, bool]:
+        """Returns the result of the call and True if it was made by another caller"""
+        while (future := self._calls.get(key)) is not None:
+            logger.debug('Waiting in-flight call for key `%s`', key)
+            try:
+                return await asyncio.shield(future), True
+            except asyncio.CancelledError:
+                # The call was cancelled with its caller, one of the waiters makes it again
+                if not future.cancelled():
+                    raise
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as err:
+            future.set_exception(err)
+            future.exception()  # Waiters get the error, it is not logged as never retrieved
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            del self._calls[key]
+        return result, False
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    size: int
+    maxsize: int
+    ttl: float
+
+
+def _make_key(*args: Any, **kwargs: Any) -> Hashable:
+    return args, tuple(sorted(kwargs.items()))
+
+
+def async_ttl_cache(
+    ttl: float = 60,
+    maxsize: int = 128,
+    key: Callable[..., Hashable] = _make_key,
+) -> Callable[[AsyncFuncType], AsyncFuncType]:
+    """Memoizes results of a coroutine function in the process for `ttl` seconds.
+
+    Holds up to `maxsize` least recently used results, errors are not cached.
+    Concurrent calls with the same key wait for the single in-flight call.
+    The wrapper has `invalidate(*args, **kwargs)`, `cache_clear()` and `cache_info()`.
+    """
+
+    def decorator(func: AsyncFuncType) -> AsyncFuncType:
+        cache: TTLCache[Hashable, Any] = TTLCache(maxsize, ttl)
+        calls: SingleFlight[Any] = SingleFlight()
+        stats = {'hits': 0, 'misses': 0}
+        missing = object()
+
+        @wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            cache_key = key(*args, **kwargs)
+            result = cache.get(cache_key, missing)
+            if result is not missing:
+                stats['hits'] += 1
+                return result
+
+            async def call() -> Any:
+                result = await func(*args, **kwargs)
+                cache.set(cache_key, result)
+                return result
+
+            result, shared = await calls.run(cache_key, call)
+            stats['hits' if shared else 'misses'] += 1
+            return result
+
+        def invalidate(*args: Any, **kwargs: Any) -> None:
+            cache.pop(key(*args, **kwargs))
+
+        def cache_clear() -> None:
+            cache.clear()
+            stats['hits'] = stats['misses'] = 0
+
+        def cache_info() -> CacheInfo:
+            return CacheInfo(stats['hits'], stats['misses'], len(cache), maxsize, ttl)
+
+        wrapper.invalidate = invalidate
+        wrapper.cache_clear = cache_clear
+        wrapper.cache_info = cache_info
+        return wrapper
+
+    return decorator
@@ -0,0 +1,131 @@
+import asyncio
+from logging import getLogger
+from typing import Iterable, Optional
+
+from telebot.asyncio_helper import ApiTelegramException
+
+from telebot_views import bot
+from telebot_views.outbound import Priority, outbound_priority
+
+logger = getLogger(__name__)
+
+PERMANENT_ERRORS = ('message to delete not found', "message can't be deleted")
+
+
+class DeletionQueue:
+    """Background deletion of messages.
+
+    Messages are collected for `batch_window` seconds and deleted with one `delete_messages`
+    call per chat and up to `batch_size` ids, or one by one if the bot has no bulk method.
+    Failed deletions are retried `max_retries` times and then dropped.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+        self, batch_size: int = 100, batch_window: float = 0.1, max_retries: int = 3, retry_delay: float = 1.0
+    ) -> None:
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._pending: dict[int, dict[int, int]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._batches: set[asyncio.Task] = set()
+        self._retrying = 0
+        self.deleted = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return sum(len(messages) for messages in self._pending.values())
+
+    def add(self, chat_id: int, message_id: int) -> None:
+        self.add_many([(chat_id, message_id)])
+
+    def add_many(self, messages: Iterable[tuple[int, int]]) -> None:
+        for chat_id, message_id in messages:
+            self._pending.setdefault(chat_id, {}).setdefault(message_id, 0)
+        if not self._pending:
+            return
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._worker())
+
+    async def join(self) -> None:
+        """Wait until all added messages are deleted or dropped"""
+        while self._pending or self._batches or self._retrying:
+            await asyncio.sleep(self.batch_window)
+
+    async def _worker(self) -> None:
+        with outbound_priority(Priority.BULK):
+            while True:
+                if not self._pending:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), 60)
+                    except asyncio.TimeoutError:
+                        if not self._pending:
+                            return
+                    continue
+
+                await asyncio.sleep(self.batch_window)
+                pending, self._pending = self._pending, {}
+                for chat_id, messages in pending.items():
+                    message_ids = list(messages)
+                    for i in range(0, len(message_ids), self.batch_size):
+                        batch = {m: messages[m] for m in message_ids[i : i + self.batch_size]}
+                        task = asyncio.create_task(self._delete(chat_id, batch))
+                        self._batches.add(task)
+                        task.add_done_callback(self._batches.discard)
+
+    async def _delete(self, chat_id: int, messages: dict[int, int]) -> None:
+        """Deletes messages of the chat, `messages` maps message ids to their attempts"""
+        if not hasattr(bot.bot, 'delete_messages'):
+            await self._delete_one_by_one(chat_id, messages)
+            return
+        try:
+            await bot.bot.delete_messages(chat_id, list(messages))
+        except Exception as err:  # pylint: disable=broad-except
+            self._retry(chat_id, messages, err)
+            return
+        self.deleted += len(messages)
+
+    async def _delete_one_by_one(self, chat_id: int, messages: dict[int, int]) -> None:
+        results = await asyncio.gather(
+            *(bot.bot.delete_message(chat_id, message_id) for message_id in messages),
+            return_exceptions=True,
+        )
+        failed: dict[int, int] = {}
+        error: Optional[BaseException] = None
+        for (message_id, attempts), result in zip(messages.items(), results):
+            if not isinstance(result, BaseException):
+                self.deleted += 1
+            elif isinstance(result, ApiTelegramException) and any(e in result.description for e in PERMANENT_ERRORS):
+                self.dropped += 1
+            else:
+                failed[message_id] = attempts
+                error = result
+        if failed:
+            self._retry(chat_id, failed, error)
+
+    def _retry(self, chat_id: int, messages: dict[int, int], err: Optional[BaseException]) -> None:
+        retry = {message_id: attempts + 1 for message_id, attempts in messages.items() if attempts < self.max_retries}
+        dropped = len(messages) - len(retry)
+        if dropped:
+            self.dropped += dropped
+            logger.warning('Dropped %s messages to delete in chat %s: %s', dropped, chat_id, err)
+        if retry:
+            self._retrying += 1
+            asyncio.get_running_loop().call_later(self.retry_delay, self._requeue, chat_id, retry)
+
+    def _requeue(self, chat_id: int, messages: dict[int, int]) -> None:
+        self._retrying -= 1
+        for message_id, attempts in messages.items():
+            self._pending.setdefault(chat_id, {})[message_id] = attempts
+        self.add_many(())
+
+
+deletion_queue = DeletionQueue()
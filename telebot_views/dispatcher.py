@@ -1,22 +1,44 @@
+import asyncio
+
 from telebot_views.base import Request
 from telebot_views.models import UserStateCb
+from telebot_views.services.users import save_user, user_identity_map
 
 
 class ViewDispatcher:
     """Диспетчер видов.
     По заданному запросу Request определяет, какой вид нужно выбрать
     для передачи запроса и отработки реакции на действие пользователя.
+
+    В режиме `concurrent` callback отвечается сразу после выбора вида,
+    а сохранение состояния выполняется параллельно с остальными побочными эффектами.
     """
 
+    concurrent: bool = False
+
     def __init__(self, request: Request):
         self.request = request
 
     async def dispatch(self):
-        route = await self.request.get_route()
-        user = await self.request.get_user()
-        callback = UserStateCb()
-        if self.request.callback:
-            callback = user.state.callbacks[self.request.callback.data]
-        next_route = await route.view(self.request, callback, **callback.view_params).dispatch()
-        user.state.view_name = next_route.value
-        await user.update()
+        try:
+            route = await self.request.get_route()
+            user = await self.request.get_user()
+            callback = UserStateCb()
+            if self.request.callback:
+                callback = await self.request.get_callback()
+                if callback is None:
+                    raise KeyError(self.request.callback.data)
+            view = route.view(self.request, callback, **callback.view_params)
+            self.request.concurrent = self.concurrent
+            if self.concurrent and not view.late_callback_answer:
+                # Hides the spinner on the button while the view renders
+                self.request.run_concurrently(view.callbacks.answer_callback())
+            next_route = await view.dispatch()
+            user.state.view_name = next_route.value
+            await asyncio.gather(save_user(user), self.request.wait_side_effects())
+        except BaseException:
+            # The cached user may be modified halfway
+            user_identity_map.evict(self.request.actual_field.from_user.id)
+            # Side effects, e.g. the early callback answer, are finished and their errors retrieved
+            await self.request.wait_side_effects(return_exceptions=True)
+            raise
@@ -14,6 +14,7 @@ class DummyMessageSender(BaseMessageSender):
 
 
 class DummyInlineQueryResultSender(InlineQueryResultSender):
+    # pylint: disable=abstract-method
     async def get_results(self) -> tuple[list[InlineQueryResultBase], str | None]:
         return [], None
 
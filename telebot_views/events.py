@@ -0,0 +1,95 @@
+import asyncio
+from logging import getLogger
+from typing import Any, Callable
+from uuid import uuid4
+
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+from telebot_models.models import CollectionGetter
+
+from telebot_views.utils import now_utc
+
+COLL_NAME = 'telebot_views_events'
+COLL_SIZE = 1024 * 1024 * 8
+logger = getLogger(__name__)
+
+EventHandler = Callable[[dict[str, Any]], None]
+
+
+class EventBus:
+    """Cross-node notifications over a capped Mongo collection.
+
+    Nodes publish small documents and tail the collection with an awaitable cursor,
+    so it works on standalone servers where change streams are not available.
+    Events published by the current node are not delivered back to it.
+    """
+
+    def __init__(self) -> None:
+        self.node_id = uuid4().hex
+        self.enabled = False
+        self._handlers: dict[str, list[EventHandler]] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def subscribe(self, topic: str, handler: EventHandler) -> None:
+        self._handlers.setdefault(topic, []).append(handler)
+
+    def publish(self, topic: str, payload: dict[str, Any]) -> None:
+        """Publish an event in background. Does nothing until `listen` is started."""
+        if not self.enabled:
+            return
+        task = asyncio.create_task(self._publish(topic, payload))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _publish(self, topic: str, payload: dict[str, Any]) -> None:
+        collection = CollectionGetter.get_collection(COLL_NAME)
+        try:
+            await collection.insert_one(
+                {'topic': topic, 'node_id': self.node_id, 'payload': payload, 'created_at': now_utc()}
+            )
+        except PyMongoError:
+            logger.warning('Event `%s` was not published', topic, exc_info=True)
+
+    async def listen(self) -> None:
+        await init_events_collection()
+        collection = CollectionGetter.get_collection(COLL_NAME)
+        last = await collection.find_one(sort=[('$natural', -1)])
+        last_id = last['_id'] if last else None
+        self.enabled = True
+        logger.info('Listening events as node `%s`', self.node_id)
+
+        while True:
+            # Ids are only used to skip already seen events after the cursor is reopened
+            query = {'_id': {'$gt': last_id}} if last_id else {}
+            cursor = collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+            try:
+                async for doc in cursor:
+                    last_id = doc['_id']
+                    self._deliver(doc)
+            except PyMongoError:
+                logger.warning('Events cursor error', exc_info=True)
+            await asyncio.sleep(1)
+
+    def _deliver(self, doc: dict[str, Any]) -> None:
+        if doc.get('node_id') == self.node_id:
+            return
+        for handler in self._handlers.get(doc.get('topic'), []):
+            try:
+                handler(doc.get('payload') or {})
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('Event handler error for topic `%s`', doc.get('topic'))
+
+
+event_bus = EventBus()
+
+
+async def init_events_collection() -> None:
+    logger.info('Init events collection...')
+    collection = CollectionGetter.get_collection(COLL_NAME)
+    try:
+        await collection.database.create_collection(COLL_NAME, capped=True, size=COLL_SIZE)
+        # A tailable cursor over an empty capped collection is closed immediately
+        await collection.insert_one({'topic': 'init', 'node_id': '', 'payload': {}, 'created_at': now_utc()})
+    except CollectionInvalid:
+        pass
+    logger.info('Init events collection done')
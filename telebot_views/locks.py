@@ -1,35 +1,319 @@
 import asyncio
+import heapq
+from collections import deque
+from contextlib import suppress
 from datetime import timedelta
+from enum import Enum
+from itertools import count
 from logging import getLogger
-from typing import Optional
+from typing import Callable, Optional
 from uuid import uuid4
 
-from pymongo import ReturnDocument
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, PyMongoError
 from telebot_models.models import CollectionGetter
 
+from telebot_views.events import event_bus
 from telebot_views.utils import now_utc
 
 COLL_NAME = 'telebot_views_locks'
+LOCK_RELEASED_TOPIC = 'lock_released'
+POLL_INTERVAL = 0.5  # Fallback for releases that were not notified
+RENEW_BATCH_WINDOW = 0.1  # Leases due within this window are renewed together
+RENEW_RETRY_DELAY = 1.0
 logger = getLogger(__name__)
 
 
+class _Waiter:
+    def __init__(self) -> None:
+        self.event = asyncio.Event()
+        self.ready = False
+
+
+class LockWaitQueue:
+    """FIFO queue of the same process waiters for every lock key.
+
+    Only the head of a queue tries to acquire a lock. It is woken up by `notify`
+    when the key is released by this process or by another node, polling is only a fallback.
+    Other waiters sleep until they become the head.
+    """
+
+    def __init__(self) -> None:
+        self._queues: dict[str, deque[_Waiter]] = {}
+
+    def has_waiters(self, key: str) -> bool:
+        return bool(self._queues.get(key))
+
+    def enqueue(self, key: str) -> _Waiter:
+        waiter = _Waiter()
+        self._queues.setdefault(key, deque()).append(waiter)
+        return waiter
+
+    def remove(self, key: str, waiter: _Waiter, acquired: bool) -> None:
+        queue = self._queues.get(key)
+        if not queue:
+            return
+        was_head = queue[0] is waiter
+        with suppress(ValueError):
+            queue.remove(waiter)
+        if not queue:
+            del self._queues[key]
+        elif was_head:
+            # The next waiter becomes the head. It may try at once only if the lock was not taken
+            self._wake(queue[0], ready=not acquired)
+
+    def notify(self, key: str) -> None:
+        queue = self._queues.get(key)
+        if queue:
+            self._wake(queue[0], ready=True)
+
+    async def wait(self, key: str, waiter: _Waiter, timeout: float) -> bool:
+        """Waits for a wake up. Returns True if the lock may be free."""
+        is_head = self._queues[key][0] is waiter
+        try:
+            await asyncio.wait_for(waiter.event.wait(), timeout if is_head else None)
+        except asyncio.TimeoutError:
+            return is_head
+        ready, waiter.ready = waiter.ready, False
+        waiter.event.clear()
+        return ready
+
+    @staticmethod
+    def _wake(waiter: _Waiter, ready: bool) -> None:
+        waiter.ready = waiter.ready or ready
+        waiter.event.set()
+
+
+class AcquireResult:
+    """Result of `Lock.acquire` with timing data. Evaluates to True if the lock was acquired."""
+
+    def __init__(self, acquired: bool, attempts: int, waited: float, elapsed: float) -> None:
+        self.acquired = acquired
+        self.attempts = attempts  # Every attempt is a single round trip
+        self.waited = waited  # Seconds spent in the wait queue
+        self.elapsed = elapsed
+
+    def __bool__(self) -> bool:
+        return self.acquired
+
+    def __repr__(self) -> str:
+        return (
+            f'AcquireResult(acquired={self.acquired}, attempts={self.attempts}, '
+            f'waited={self.waited:.4f}, elapsed={self.elapsed:.4f})'
+        )
+
+
+class LeaseManager:
+    """Renews leases of every held lock of the process.
+
+    Leases are kept in a deadline heap. A single task sleeps until the next renewal is due
+    and renews every lock due in that tick with one `bulk_write`.
+    Holders of the locks that were not renewed are told that the lease is lost.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self) -> None:
+        self._heap: list[tuple[float, int, 'MongoLock', int]] = []
+        self._counter = count()
+        self._stale = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.wakeups = 0
+        self.writes = 0
+        self.renewals = 0
+
+    def __len__(self) -> int:
+        return len(self._heap) - self._stale
+
+    def add(self, lock: 'MongoLock', lease: int) -> None:
+        self._push(asyncio.get_running_loop().time() + lock.renew_interval, lock, lease)
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        elif self._heap[0][2] is lock and self._wakeup is not None:
+            self._wakeup.set()
+
+    def discard(self) -> None:
+        """Marks a lease as released. Released leases are skipped and compacted lazily."""
+        self._stale += 1
+        if self._stale > 64 and self._stale > len(self._heap) // 2:
+            self._heap = [entry for entry in self._heap if entry[2].lease_is_valid(entry[3])]
+            heapq.heapify(self._heap)
+            self._stale = 0
+
+    def _push(self, deadline: float, lock: 'MongoLock', lease: int) -> None:
+        heapq.heappush(self._heap, (deadline, next(self._counter), lock, lease))
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        assert self._wakeup is not None
+        while self._heap:
+            delay = self._heap[0][0] - loop.time()
+            if delay > 0:
+                self._wakeup.clear()
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                self.wakeups += 1
+                continue
+
+            due: list[tuple['MongoLock', int]] = []
+            horizon = loop.time() + RENEW_BATCH_WINDOW
+            while self._heap and self._heap[0][0] <= horizon:
+                _, _, lock, lease = heapq.heappop(self._heap)
+                if lock.lease_is_valid(lease):
+                    due.append((lock, lease))
+                else:
+                    self._stale = max(0, self._stale - 1)
+            if due:
+                await self._renew(due)
+
+    async def _renew(self, due: list[tuple['MongoLock', int]]) -> None:
+        loop = asyncio.get_running_loop()
+        collection = CollectionGetter.get_collection(COLL_NAME)
+        now = now_utc()
+        requests = [
+            UpdateOne({'lock_id': str(lock.lock_id), 'key': lock.lock_key}, {'$set': {'acquired_at': now}})
+            for lock, _ in due
+        ]
+        self.writes += 1
+        try:
+            result = await collection.bulk_write(requests, ordered=False)
+        except PyMongoError:
+            logger.warning('Leases of %s locks were not renewed. Retrying...', len(due), exc_info=True)
+            for lock, lease in due:
+                self._push(loop.time() + RENEW_RETRY_DELAY, lock, lease)
+            return
+
+        held = {str(lock.lock_id) for lock, _ in due}
+        if result.matched_count < len(due):
+            lock_ids = list(held)
+            held = {doc['lock_id'] async for doc in collection.find({'lock_id': {'$in': lock_ids}}, {'lock_id': 1})}
+
+        for lock, lease in due:
+            if str(lock.lock_id) in held:
+                self.renewals += 1
+                self._push(loop.time() + lock.renew_interval, lock, lease)
+            elif lock.lease_is_valid(lease):
+                lock.lose_lease()
+        logger.debug('Leases renewed: %s of %s', result.matched_count, len(due))
+
+
+wait_queue = LockWaitQueue()
+lease_manager = LeaseManager()
+event_bus.subscribe(LOCK_RELEASED_TOPIC, lambda payload: wait_queue.notify(payload.get('key', '')))
+
+
+class LockMode(str, Enum):
+    """Lock backends"""
+
+    LOCAL = 'local'  # In-process keyed asyncio locks
+    MONGO = 'mongo'  # Distributed locks in Mongo
+    HYBRID = 'hybrid'  # Local lock first, then Mongo if more than one node is configured
+
+
+class LockSettings:
+    """Settings for locks"""
+
+    mode: LockMode = LockMode.MONGO
+    nodes: int = 1
+
+
+def set_lock_mode(mode: LockMode, nodes: int = 1) -> None:
+    LockSettings.mode = LockMode(mode)
+    LockSettings.nodes = nodes
+
+
 class Lock:
+    """Lock with the backend selected by `set_lock_mode`.
+
+    `Lock(...)` creates `MongoLock`, `LocalLock` or `HybridLock` with the same arguments.
+    """
+
     # pylint: disable=too-many-instance-attributes
-    _task: Optional[asyncio.Task] = None
 
-    def __init__(self, lock_key: str, lock_ttl: int, wait: bool = True, reacquire: bool = True) -> None:
+    def __new__(cls, *_args, **_kwargs) -> 'Lock':
+        backend = LOCK_BACKENDS[LockSettings.mode] if cls is Lock else cls
+        return super().__new__(backend)
+
+    def __init__(
+        self,
+        lock_key: str,
+        lock_ttl: int,
+        wait: bool = True,
+        reacquire: bool = True,
+        confirm_release: bool = True,
+        on_lease_lost: Optional[Callable[['Lock'], None]] = None,
+    ) -> None:
+        # pylint: disable=too-many-arguments
         self._lock_key = lock_key
         self._lock_ttl = lock_ttl
+        self._wait = wait
+        self._reacquire = reacquire
+        self._confirm_release = confirm_release
+        self._on_lease_lost = on_lease_lost
+        self.lease_lost = asyncio.Event()
+        self.last_acquire: Optional[AcquireResult] = None
+
+    @property
+    def lock_key(self) -> str:
+        return self._lock_key
+
+    def locked(self) -> bool:
+        raise NotImplementedError
+
+    async def acquire(self) -> AcquireResult:
+        raise NotImplementedError
+
+    async def release(self, confirm: Optional[bool] = None) -> None:
+        raise NotImplementedError
+
+    async def __aenter__(self) -> None:
+        await self.acquire()
+        return None
+
+    async def __aexit__(self, _exc_type, _exc, _tb) -> None:
+        await self.release()
+
+
+class MongoLock(Lock):
+    """Distributed lock stored in Mongo"""
+
+    # pylint: disable=too-many-instance-attributes
+    _background_tasks: set[asyncio.Task] = set()
+
+    def __init__(self, lock_key: str, lock_ttl: int, *args, **kwargs) -> None:
+        super().__init__(lock_key, lock_ttl, *args, **kwargs)
         self._collection = CollectionGetter.get_collection(COLL_NAME)
         self._lock_id = uuid4()
         self._async_lock = asyncio.Lock()
-        self._wait = wait
-        self._reacquire = reacquire
+        self._attempts = 0
+        self._lease = 0
+        self._held = False
+
+    @property
+    def lock_id(self) -> str:
+        return str(self._lock_id)
+
+    @property
+    def renew_interval(self) -> float:
+        return max(0.3, self._lock_ttl - int(self._lock_ttl / 2))
 
     def locked(self) -> bool:
         return self._async_lock.locked()
 
-    async def acquire(self) -> bool:
+    def lease_is_valid(self, lease: int) -> bool:
+        return self._held and self._lease == lease
+
+    def lose_lease(self) -> None:
+        """Called by the lease manager when the lock was taken by someone else or expired"""
+        logger.warning('Lease of Lock `%s` was lost', self._lock_key)
+        self._held = False
+        self.lease_lost.set()
+        if self._on_lease_lost is not None:
+            self._on_lease_lost(self)
+
+    async def acquire(self) -> AcquireResult:
         logger.debug('Acquiring Lock `%s`...', self._lock_key)
         if self.locked():
             raise AlreadyLocked
@@ -38,38 +322,64 @@ class Lock:
         await self._async_lock.acquire()
         logger.debug('Async Lock `%s` acquired', self._lock_key)
 
-        last_log = asyncio.get_running_loop().time()
-        while True:
-            now = now_utc()
-            await self._collection.update_one({'key': self._lock_key}, {'$set': {'key': self._lock_key}}, upsert=True)
-            doc = await self._collection.find_one_and_update(
-                {
-                    'key': self._lock_key,
-                    '$or': [
-                        {'acquired_at': None},
-                        {'acquired_at': {'$lt': now - timedelta(seconds=self._lock_ttl)}},
-                    ],
-                },
-                {'$set': {'key': self._lock_key, 'lock_id': str(self._lock_id), 'acquired_at': now}},
-                return_document=ReturnDocument.AFTER,
-            )
-            result = doc is not None
-            if result or not result and not self._wait:
-                break
+        started = asyncio.get_running_loop().time()
+        waited = 0.0
+        self._attempts = 0
+        result = False
+        if not self._wait or not wait_queue.has_waiters(self._lock_key):
+            result = await self._try_acquire()
 
-            if asyncio.get_running_loop().time() - last_log > 5:
-                logger.debug('Lock `%s` was not acquired. Waiting...', self._lock_key)
-                last_log = asyncio.get_running_loop().time()
+        if not result and self._wait:
+            last_log = waiting_since = asyncio.get_running_loop().time()
+            waiter = wait_queue.enqueue(self._lock_key)
+            try:
+                while not result:
+                    if await wait_queue.wait(self._lock_key, waiter, POLL_INTERVAL):
+                        result = await self._try_acquire()
 
-            await asyncio.sleep(0.5)
+                    if not result and asyncio.get_running_loop().time() - last_log > 5:
+                        logger.debug('Lock `%s` was not acquired. Waiting...', self._lock_key)
+                        last_log = asyncio.get_running_loop().time()
+            finally:
+                wait_queue.remove(self._lock_key, waiter, acquired=result)
+                waited = asyncio.get_running_loop().time() - waiting_since
 
         if result is True:
             logger.debug('Lock `%s` was acquired', self._lock_key)
+            self._held = True
+            self._lease += 1
+            self.lease_lost.clear()
             if self._reacquire:
-                self._task = asyncio.create_task(self._reacquire_task())
+                lease_manager.add(self, self._lease)
         else:
             logger.debug('Lock `%s` was not acquired', self._lock_key)
-        return result
+
+        self.last_acquire = AcquireResult(result, self._attempts, waited, asyncio.get_running_loop().time() - started)
+        return self.last_acquire
+
+    async def _try_acquire(self) -> bool:
+        """Takes a free or an expired lock with a single conditional upsert.
+
+        If the key is held by someone else the filter does not match,
+        and the upsert fails on the unique `key` index.
+        """
+        self._attempts += 1
+        now = now_utc()
+        try:
+            await self._collection.update_one(
+                {
+                    'key': self._lock_key,
+                    '$or': [
+                        {'acquired_at': None},
+                        {'acquired_at': {'$lt': now - timedelta(seconds=self._lock_ttl)}},
+                    ],
+                },
+                {'$set': {'lock_id': str(self._lock_id), 'acquired_at': now}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False
+        return True
 
     async def reacquire(self) -> bool:
         if not self.locked():
@@ -88,38 +398,162 @@ class Lock:
             logger.debug('Lock `%s` was not reacquired\n%s', self._lock_key, doc)
         return result
 
-    async def release(self) -> None:
+    async def release(self, confirm: Optional[bool] = None) -> None:
+        """Releases the lock. Without confirmation the lock document is deleted in background."""
         logger.debug('Releasing Lock `%s`...', self._lock_key)
+        if confirm is None:
+            confirm = self._confirm_release
         if self.locked():
-            doc = await self._collection.find_one_and_delete(
-                {'lock_id': str(self._lock_id), 'key': self._lock_key},
-            )
-            if not doc:
-                logger.debug('Doc for Lock `%s` was not deleted\n%s', self._lock_key, doc)
+            was_held, self._held = self._held, False
+            if was_held and self._reacquire:
+                lease_manager.discard()
+            if confirm:
+                await self._delete(raise_errors=True)
+            else:
+                task = asyncio.create_task(self._delete(raise_errors=False))
+                self._background_tasks.add(task)
+                task.add_done_callback(self._background_tasks.discard)
             self._async_lock.release()
             logger.debug('Async Lock `%s` was released', self._lock_key)
-            if self._task:
-                await self._task
         logger.debug('Lock `%s` was released', self._lock_key)
 
-    async def _reacquire_task(self) -> None:
-        threshold = max(0.3, self._lock_ttl - int(self._lock_ttl / 2))
-        last_try = asyncio.get_running_loop().time()
-        logger.debug('Reacquiring task for Lock `%s` started every %s', self._lock_key, threshold)
-        while self.locked():
-            await asyncio.sleep(0.05)
-            if asyncio.get_running_loop().time() - last_try > threshold:
-                last_try = asyncio.get_running_loop().time()
-                if not await self.reacquire():
-                    break
-        logger.debug('Reacquiring task for Lock `%s` cancelled', self._lock_key)
+    async def _delete(self, raise_errors: bool) -> None:
+        try:
+            result = await self._collection.delete_one({'lock_id': str(self._lock_id), 'key': self._lock_key})
+        except PyMongoError:
+            if raise_errors:
+                raise
+            logger.warning('Doc for Lock `%s` was not deleted. It expires in %ss', self._lock_key, self._lock_ttl)
+            return
+        if not result.deleted_count:
+            logger.debug('Doc for Lock `%s` was not deleted', self._lock_key)
+        wait_queue.notify(self._lock_key)
+        event_bus.publish(LOCK_RELEASED_TOPIC, {'key': self._lock_key})
 
-    async def __aenter__(self) -> None:
-        await self.acquire()
-        return None
 
-    async def __aexit__(self, _exc_type, _exc, _tb) -> None:
-        await self.release()
+class LocalLockRegistry:
+    """Keyed asyncio locks of the process. A key is removed when nobody holds or waits for it."""
+
+    def __init__(self) -> None:
+        self._locks: dict[str, tuple[asyncio.Lock, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    def retain(self, key: str) -> asyncio.Lock:
+        lock, refs = self._locks.get(key) or (asyncio.Lock(), 0)
+        self._locks[key] = (lock, refs + 1)
+        return lock
+
+    def release(self, key: str) -> None:
+        lock, refs = self._locks[key]
+        if refs > 1:
+            self._locks[key] = (lock, refs - 1)
+        else:
+            del self._locks[key]
+
+
+local_locks = LocalLockRegistry()
+
+
+class LocalLock(Lock):
+    """In-process lock. Waiters of the same key are granted the lock in FIFO order."""
+
+    _lock: Optional[asyncio.Lock] = None
+    _held = False
+
+    def locked(self) -> bool:
+        return self._lock is not None
+
+    async def acquire(self) -> AcquireResult:
+        logger.debug('Acquiring local Lock `%s`...', self._lock_key)
+        if self.locked():
+            raise AlreadyLocked
+
+        started = asyncio.get_running_loop().time()
+        self._lock = local_locks.retain(self._lock_key)
+        if self._wait or not self._lock.locked():
+            try:
+                await self._lock.acquire()
+            except BaseException:
+                local_locks.release(self._lock_key)
+                self._lock = None
+                raise
+            self._held = True
+
+        elapsed = asyncio.get_running_loop().time() - started
+        self.last_acquire = AcquireResult(self._held, 0, elapsed, elapsed)
+        return self.last_acquire
+
+    async def release(self, confirm: Optional[bool] = None) -> None:
+        if self._lock is None:
+            return
+        if self._held:
+            self._lock.release()
+        local_locks.release(self._lock_key)
+        self._lock = None
+        self._held = False
+        logger.debug('Local Lock `%s` was released', self._lock_key)
+
+
+class HybridLock(Lock):
+    """Takes a local lock first. Goes to Mongo only when more than one node is configured."""
+
+    def __init__(self, lock_key: str, lock_ttl: int, *args, **kwargs) -> None:
+        super().__init__(lock_key, lock_ttl, *args, **kwargs)
+        self._local = LocalLock(lock_key, lock_ttl, wait=self._wait)
+        self._mongo: Optional[MongoLock] = None
+        if LockSettings.nodes > 1:
+            self._mongo = MongoLock(
+                lock_key,
+                lock_ttl,
+                wait=self._wait,
+                reacquire=self._reacquire,
+                confirm_release=self._confirm_release,
+                on_lease_lost=self._lose_lease,
+            )
+
+    def locked(self) -> bool:
+        return self._local.locked()
+
+    async def acquire(self) -> AcquireResult:
+        result = await self._local.acquire()
+        if result and self._mongo is not None:
+            try:
+                mongo_result = await self._mongo.acquire()
+            except BaseException:
+                # Otherwise the key stays held in the process and later updates of the user hang
+                await self._local.release()
+                raise
+            if not mongo_result:
+                await self._local.release()
+            result = AcquireResult(
+                mongo_result.acquired,
+                mongo_result.attempts,
+                result.waited + mongo_result.waited,
+                result.elapsed + mongo_result.elapsed,
+            )
+        self.last_acquire = result
+        return result
+
+    async def release(self, confirm: Optional[bool] = None) -> None:
+        try:
+            if self._mongo is not None:
+                await self._mongo.release(confirm)
+        finally:
+            await self._local.release()
+
+    def _lose_lease(self, _lock: Lock) -> None:
+        self.lease_lost.set()
+        if self._on_lease_lost is not None:
+            self._on_lease_lost(self)
+
+
+LOCK_BACKENDS: dict[LockMode, type[Lock]] = {
+    LockMode.LOCAL: LocalLock,
+    LockMode.MONGO: MongoLock,
+    LockMode.HYBRID: HybridLock,
+}
 
 
 class AlreadyLocked(Exception):
@@ -6,6 +6,7 @@ from logging.config import dictConfig
 from typing import Any
 
 from telebot_views import bot
+from telebot_views.outbound import Priority, outbound_priority
 
 DEFAULT_COMMON_FORMAT = '%(asctime)s %(levelname)7s %(name)s: %(message)s'
 
@@ -114,6 +115,7 @@ class TelegramReportsHandler(Handler):
         record.exc_info = None
         msg = self.format(record)
         try:
-            await bot.reports_bot.send_message(bot.reports_chat_id, msg[:3000])
+            with outbound_priority(Priority.REPORTS):
+                await bot.reports_bot.send_message(bot.reports_chat_id, msg[:3000])
         except Exception:  # pylint: disable=broad-except
             logger.warning('Log error')
@@ -0,0 +1,100 @@
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, Optional, TypeVar
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+
+class TTLCache(Generic[K, V]):
+    """In-process LRU cache with TTL.
+
+    Holds up to `maxsize` entries and, if `maxbytes` is set, up to `maxbytes` of values
+    measured by `sizeof`. The least recently used entry is evicted first.
+    Expired entries are dropped on access or by `expire`.
+    `on_evict` is called with entries dropped by the cache, not with entries taken by `pop`.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: float = 60,
+        timer: Callable[[], float] = time.monotonic,
+        maxbytes: int = 0,
+        sizeof: Optional[Callable[[V], int]] = None,
+        on_evict: Optional[Callable[[K, V], None]] = None,
+    ):
+        # pylint: disable=too-many-arguments
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.on_evict = on_evict
+        self._data: OrderedDict[K, tuple[float, V, int]] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: K) -> bool:
+        return self.get(key) is not None
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        item = self._data.get(key)
+        if item is None or item[0] <= self.timer():
+            if item is not None:
+                self._remove(key, evicted=True)
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def set(self, key: K, value: V, ttl: Optional[float] = None) -> None:
+        size = self.sizeof(value) if self.maxbytes and self.sizeof else 0
+        previous = self._data.get(key)
+        self._remove(key, evicted=previous is not None and previous[1] is not value)
+        if self.maxbytes and size > self.maxbytes:
+            if self.on_evict is not None:
+                self.on_evict(key, value)
+            return
+        self._data[key] = (self.timer() + (self.ttl if ttl is None else ttl), value, size)
+        self.bytes += size
+        while len(self._data) > self.maxsize or (self.maxbytes and self.bytes > self.maxbytes):
+            self._remove(next(iter(self._data)), evicted=True)
+
+    def pop(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        item = self._data.get(key)
+        expired = item is not None and item[0] <= self.timer()
+        self._remove(key, evicted=expired)
+        if item is None or expired:
+            return default
+        return item[1]
+
+    def expire(self) -> None:
+        """Drops all expired entries"""
+        now = self.timer()
+        for key in [key for key, item in self._data.items() if item[0] <= now]:
+            self._remove(key, evicted=True)
+
+    def _remove(self, key: K, evicted: bool = False) -> None:
+        item = self._data.pop(key, None)
+        if item is not None:
+            self.bytes -= item[2]
+            if evicted and self.on_evict is not None:
+                self.on_evict(key, item[1])
+
+    def keys(self) -> list[K]:
+        return list(self._data)
+
+    def clear(self) -> None:
+        data, self._data = self._data, OrderedDict()
+        self.bytes = 0
+        if self.on_evict is not None:
+            for key, item in data.items():
+                self.on_evict(key, item[1])
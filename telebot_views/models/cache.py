@@ -1,12 +1,23 @@
-from datetime import datetime, timedelta
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
 from logging import getLogger
-from typing import Any, Callable, ClassVar, Type
+from typing import Any, Callable, ClassVar, Iterable, Optional, Type
 
+import bson
 from pydantic import Field
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from telebot_models.models import BaseModelManager, Model
 
+from telebot_views.cache_backends import CacheBackend, CacheEntry
+from telebot_views.decorators.cache import SingleFlight
+from telebot_views.events import event_bus
+from telebot_views.locks import MongoLock
+from telebot_views.lru import TTLCache
 from telebot_views.utils import now_utc
 
+CACHE_INVALIDATED_TOPIC = 'cache_invalidated'
 logger = getLogger(__name__)
 
 
@@ -15,6 +26,7 @@ class CacheModel(Model):
 
     key: str
     data: dict = Field(default_factory=dict)
+    fresh_until: datetime | None = None
     valid_until: datetime | None = None
 
     manager: ClassVar[Type['CacheModelManager']]
@@ -33,43 +45,206 @@ class CacheModelManager(BaseModelManager[CacheModel]):
         return self.filter({'valid_until': {'$gt': now_utc()}})
 
 
+def _aware(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+class MongoCacheBackend(CacheBackend):
+    """Cache in the `caches` collection shared by all nodes"""
+
+    @staticmethod
+    def _entry(cache: dict) -> CacheEntry:
+        fresh_until, valid_until = cache.get('fresh_until'), cache.get('valid_until')
+        return CacheEntry(cache['data'], fresh_until and _aware(fresh_until), valid_until and _aware(valid_until))
+
+    @staticmethod
+    def _update(key: str, entry: CacheEntry) -> tuple[dict, dict]:
+        update = {'data': entry.data, 'fresh_until': entry.fresh_until, 'valid_until': entry.valid_until}
+        return {'key': key}, {'$set': update}
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        cache = await CacheModelManager.get_collection().find_one({'key': key, 'valid_until': {'$gt': now_utc()}})
+        return None if cache is None else self._entry(cache)
+
+    async def get_many(self, keys: Iterable[str]) -> dict[str, CacheEntry]:
+        query = {'key': {'$in': list(keys)}, 'valid_until': {'$gt': now_utc()}}
+        return {cache['key']: self._entry(cache) async for cache in CacheModelManager.get_collection().find(query)}
+
+    async def set(self, key: str, entry: CacheEntry) -> None:
+        collection = CacheModelManager.get_collection()
+        try:
+            await collection.update_one(*self._update(key, entry), upsert=True)
+        except DuplicateKeyError:
+            # Another process inserted the key concurrently
+            await collection.update_one(*self._update(key, entry))
+
+    async def set_many(self, entries: dict[str, CacheEntry]) -> None:
+        if not entries:
+            return
+        requests = [UpdateOne(*self._update(key, entry), upsert=True) for key, entry in entries.items()]
+        try:
+            await CacheModelManager.get_collection().bulk_write(requests, ordered=False)
+        except BulkWriteError:
+            # Keys inserted concurrently by another process are updated without upsert
+            await CacheModelManager.get_collection().bulk_write(
+                [UpdateOne(*self._update(key, entry)) for key, entry in entries.items()], ordered=False
+            )
+
+    async def delete(self, key: str) -> None:
+        await CacheModelManager.get_collection().delete_one({'key': key})
+
+
+class CacheSettings:
+    """Settings of `with_cache`.
+
+    `backend` stores the cache, the in-process tier is put in front of backends with `local_tier`.
+    """
+
+    backend: CacheBackend = MongoCacheBackend()
+    local_ttl: float = 10
+    local_maxsize: int = 1024
+    local_maxbytes: int = 1024 * 1024 * 8
+    # Concurrent misses of different nodes are coalesced through a Mongo lease of `lease_ttl` seconds
+    distributed_single_flight: bool = False
+    lease_ttl: int = 10
+
+
+def _sizeof(entry: CacheEntry) -> int:
+    return len(bson.encode(entry.data))
+
+
+local_cache: TTLCache[str, CacheEntry] = TTLCache(
+    CacheSettings.local_maxsize,
+    CacheSettings.local_ttl,
+    maxbytes=CacheSettings.local_maxbytes,
+    sizeof=_sizeof,
+)
+
+
+def configure_local_cache(ttl: float = 10, maxsize: int = 1024, maxbytes: int = 1024 * 1024 * 8) -> None:
+    CacheSettings.local_ttl = local_cache.ttl = ttl
+    CacheSettings.local_maxsize = local_cache.maxsize = maxsize
+    CacheSettings.local_maxbytes = local_cache.maxbytes = maxbytes
+
+
+def set_cache_backend(backend: CacheBackend) -> None:
+    CacheSettings.backend = backend
+    local_cache.clear()
+
+
+def _set_local(cache_key: str, entry: CacheEntry) -> None:
+    if not CacheSettings.backend.local_tier:
+        return
+    # The local copy never outlives the backend one
+    ttl = min(CacheSettings.local_ttl, entry.ttl())
+    if ttl > 0:
+        local_cache.set(cache_key, entry, ttl=ttl)
+
+
+async def get_cache(cache_key: str) -> CacheEntry | None:
+    """Valid, maybe stale, cached data from the process or from the backend"""
+    entry = local_cache.get(cache_key)
+    if entry is not None:
+        return entry
+    entry = await CacheSettings.backend.get(cache_key)
+    if entry is not None:
+        _set_local(cache_key, entry)
+    return entry
+
+
+async def set_cache(cache_key: str, data: dict, cache_ttl: float, stale_ttl: float = 0) -> None:
+    """Data is fresh for `cache_ttl` seconds and may be served stale for `stale_ttl` seconds more"""
+    fresh_until = now_utc() + timedelta(seconds=cache_ttl)
+    entry = CacheEntry(data, fresh_until, fresh_until + timedelta(seconds=stale_ttl))
+    await CacheSettings.backend.set(cache_key, entry)
+    _set_local(cache_key, entry)
+    event_bus.publish(CACHE_INVALIDATED_TOPIC, {'key': cache_key})
+
+
+async def invalidate_cache(cache_key: str) -> None:
+    local_cache.pop(cache_key)
+    await CacheSettings.backend.delete(cache_key)
+    event_bus.publish(CACHE_INVALIDATED_TOPIC, {'key': cache_key})
+
+
+# Local copies of other nodes are dropped if distributed events are enabled, otherwise they expire by `local_ttl`
+event_bus.subscribe(CACHE_INVALIDATED_TOPIC, lambda payload: local_cache.pop(payload.get('key')))
+
+
+_in_flight: SingleFlight[tuple[dict, Any]] = SingleFlight()
+_refresh_tasks: set[asyncio.Task] = set()
+
+
 def with_cache(
     cache_key: str,
     cache_ttl: int,
     serializer: Callable[[Any], dict] = lambda x: x,
     deserializer: Callable[[dict], Any] = lambda x: x,
     force: bool = False,
+    stale_ttl: float = 0,
+    negative_ttl: float | None = None,
+    is_negative: Callable[[Any], bool] = lambda x: not x,
+    jitter: float = 0.1,
 ):
-    def decorator(func):
-        async def wrapper(*args: Any, **kwargs: Any) -> Any:
-            cache = await CacheModel.manager().by_key(cache_key).is_valid().find_one(raise_exception=False)
+    """Caches the result in the process for up to `CacheSettings.local_ttl` seconds
+    and in `CacheSettings.backend` for `cache_ttl` seconds. `force` renews the cache.
 
-            if cache is not None:
-                logger.debug('Got cache for key `%s`', cache_key)
-                if not force:
-                    return deserializer(cache.data)
-            else:
-                logger.debug('Cache for key `%s` not found', cache_key)
+    For `stale_ttl` seconds after `cache_ttl` the stale result is returned at once
+    and renewed in background. Results matching `is_negative` are cached for `negative_ttl`
+    seconds if it is set. TTLs are spread randomly by `jitter` of their value.
+
+    Concurrent misses of the same key wait for the single in-flight call.
+    """
+    # pylint: disable=too-many-arguments
 
+    def decorator(func):
+        async def compute(*args: Any, **kwargs: Any) -> tuple[dict, Any]:
             result = await func(*args, **kwargs)
+            data = serializer(result)
+            spread = random.uniform(1 - jitter, 1 + jitter)
+            if negative_ttl is not None and is_negative(result):
+                await set_cache(cache_key, data, negative_ttl * spread)
+            else:
+                await set_cache(cache_key, data, cache_ttl * spread, stale_ttl * spread)
+            return data, result
 
-            valid_until = now_utc() + timedelta(seconds=cache_ttl)
+        async def compute_with_lease(*args: Any, **kwargs: Any) -> tuple[dict, Any]:
+            # A Mongo lock whatever the lock mode is, local locks do not coalesce misses of other processes
+            async with MongoLock(f'cache:{cache_key}', CacheSettings.lease_ttl, confirm_release=False):
+                # Another node may have renewed the cache while this one was waiting
+                entry = None if force else await get_cache(cache_key)
+                if entry is not None and not entry.is_stale():
+                    return entry.data, deserializer(entry.data)
+                return await compute(*args, **kwargs)
 
-            if cache is not None and force:
-                logger.debug('Forcing cache renew for `%s`', cache_key)
-                cache.data = serializer(result)
-                cache.valid_until = valid_until
-                await cache.update(include={'data', 'valid_until'})
+        async def load(*args: Any, **kwargs: Any) -> tuple[dict, Any]:
+            call = compute_with_lease if CacheSettings.distributed_single_flight else compute
+            (data, result), shared = await _in_flight.run(cache_key, lambda: call(*args, **kwargs))
+            # Every waiter gets its own deserialized result
+            return data, (deserializer(data) if shared else result)
 
-            if cache is not None and not force:
-                raise ValueError('Unknown behaviour')
+        async def refresh(*args: Any, **kwargs: Any) -> None:
+            try:
+                await load(*args, **kwargs)
+            except Exception:  # pylint: disable=broad-except
+                logger.warning('Cache refresh failed for key `%s`', cache_key, exc_info=True)
 
-            await CacheModel(
-                key=cache_key,
-                data=serializer(result),
-                valid_until=valid_until,
-            ).insert()
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not force:
+                entry = await get_cache(cache_key)
+                if entry is not None:
+                    logger.debug('Got cache for key `%s`', cache_key)
+                    if entry.is_stale() and cache_key not in _in_flight:
+                        logger.debug('Refreshing stale cache for key `%s`', cache_key)
+                        task = asyncio.create_task(refresh(*args, **kwargs))
+                        _refresh_tasks.add(task)
+                        task.add_done_callback(_refresh_tasks.discard)
+                    return deserializer(entry.data)
+                logger.debug('Cache for key `%s` not found', cache_key)
+            else:
+                logger.debug('Forcing cache renew for `%s`', cache_key)
 
+            _, result = await load(*args, **kwargs)
             return result
 
         return wrapper
@@ -80,6 +255,24 @@ def with_cache(
 async def init_caches_collection() -> None:
     logger.info('Init caches collection...')
     collection = CacheModelManager.get_collection()
-    await collection.create_index('key', background=True)
+    indexes = await collection.index_information()
+    if 'key_1' in indexes and not indexes['key_1'].get('unique'):
+        await remove_duplicates(collection)
+        await collection.drop_index('key_1')
+    await collection.create_index('key', unique=True, background=True)
     await collection.create_index('valid_until', expireAfterSeconds=3600 * 24 * 30, background=True)
     logger.info('Init caches collection done')
+
+
+async def remove_duplicates(collection) -> None:
+    """Keeps the latest valid document of every key"""
+    removed = 0
+    pipeline = [
+        {'$sort': {'valid_until': -1}},
+        {'$group': {'_id': '$key', 'ids': {'$push': '$_id'}, 'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gt': 1}}},
+    ]
+    async for group in collection.aggregate(pipeline, allowDiskUse=True):
+        result = await collection.delete_many({'_id': {'$in': group['ids'][1:]}})
+        removed += result.deleted_count
+    logger.info('Removed %s duplicated caches', removed)
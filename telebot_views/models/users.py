@@ -1,12 +1,12 @@
-from datetime import datetime
+import json
+from datetime import datetime, timedelta
 from logging import getLogger
-from typing import Any, ClassVar, Type
-from uuid import uuid4
+from typing import Any, ClassVar, Optional, Type
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 from telebot_models.models import BaseModelManager, Model, ModelConfig
 
-from telebot_views.utils import now_utc
+from telebot_views.utils import diff_document, now_utc, random_base62
 
 logger = getLogger(__name__)
 
@@ -14,13 +14,21 @@ logger = getLogger(__name__)
 class UserStateCb(ModelConfig, BaseModel):
     """User State Callback"""
 
-    id: str = Field(default_factory=lambda: uuid4().hex)
+    id: str = Field(default_factory=random_base62)
     view_name: str = ''
     page_num: int | None = None
     created_at: datetime | None = Field(default_factory=now_utc)
     view_params: dict = Field(default_factory=dict)
     params: dict = Field(default_factory=dict)
 
+    def get_intern_key(self) -> str:
+        """Identical callbacks have the same key and share one id"""
+        return json.dumps(
+            [self.view_name, self.page_num, self.view_params, self.params],
+            sort_keys=True,
+            default=str,
+        )
+
 
 class UserMainState(ModelConfig, BaseModel):
     """User Main State"""
@@ -30,9 +38,48 @@ class UserMainState(ModelConfig, BaseModel):
     messages_to_delete: list[tuple[int, int]] = Field(default_factory=list)
     created_at: datetime | None = Field(default_factory=now_utc)
 
+    callbacks_limit: ClassVar[int] = 500
+    callbacks_max_age: ClassVar[Optional[timedelta]] = timedelta(days=7)
+
+    _interned: dict[str, str] = PrivateAttr(default_factory=dict)
+
     def add_message_to_delete(self, chat_id: int, message_id: int):
         self.messages_to_delete.append((chat_id, message_id))
 
+    def get_interned_callback(self, callback: UserStateCb) -> Optional[UserStateCb]:
+        if len(self._interned) < len(self.callbacks):
+            self._interned = {cb.get_intern_key(): cb_id for cb_id, cb in self.callbacks.items()}
+        cb_id = self._interned.get(callback.get_intern_key())
+        return self.callbacks.get(cb_id) if cb_id is not None else None
+
+    def add_callback(self, callback: UserStateCb) -> UserStateCb:
+        """Adds the callback or returns an identical one that was added before.
+
+        Callbacks are kept in LRU order, the least recently used ones are evicted over `callbacks_limit`.
+        """
+        existing = self.get_interned_callback(callback)
+        if existing is not None:
+            callback = existing
+            self.callbacks.pop(callback.id, None)
+        self.callbacks[callback.id] = callback
+        self._interned[callback.get_intern_key()] = callback.id
+
+        while len(self.callbacks) > self.callbacks_limit:
+            evicted = self.callbacks.pop(next(iter(self.callbacks)))
+            self._interned.pop(evicted.get_intern_key(), None)
+        return callback
+
+    def prune_callbacks(self, max_age: Optional[timedelta] = None) -> None:
+        """Removes callbacks older than `max_age`"""
+        max_age = max_age or self.callbacks_max_age
+        if max_age is None:
+            return
+        threshold = now_utc() - max_age
+        for cb_id, cb in list(self.callbacks.items()):
+            if cb.created_at is not None and cb.created_at < threshold:
+                del self.callbacks[cb_id]
+                self._interned.pop(cb.get_intern_key(), None)
+
 
 class UserModel(Model):
     """User Model"""
@@ -43,12 +90,57 @@ class UserModel(Model):
     last_name: str = ''
     state: UserMainState = Field(default_factory=UserMainState)
     keyboard_id: int | None = None
+    # `<text hash>:<markup hash>` of the keyboard message as the user sees it
+    keyboard_fingerprint: str | None = None
     constants: dict[str, Any] = Field(default_factory=dict)
     is_superuser: bool = False
     is_available: bool = True
 
     manager: ClassVar[Type['UserModelManager']]
 
+    _persisted: dict[str, Any] | None = PrivateAttr(default=None)
+
+    @property
+    def is_persisted(self) -> bool:
+        return self._persisted is not None
+
+    def mark_persisted(self) -> None:
+        """Remembers the document as it is stored in Mongo"""
+        self._persisted = self.get_document()
+
+    def get_document(self) -> dict[str, Any]:
+        document = self.dict(by_alias=True)
+        document.pop('_id', None)
+        return document
+
+    def get_changes(self) -> dict[str, Any]:
+        """Minimal update of the stored document.
+
+        Changes of `state`, its `callbacks` and `constants` are set with dotted paths,
+        e.g. `state.view_name` or `state.callbacks.<id>`.
+        """
+        document = self.get_document()
+        if self._persisted is None:
+            return {'$set': document}
+        to_set, to_unset = diff_document(self._persisted, document)
+        update = {}
+        if to_set:
+            update['$set'] = to_set
+        if to_unset:
+            update['$unset'] = to_unset
+        return update
+
+    async def save(self) -> None:
+        """Inserts a new user or applies only the changes of a stored one"""
+        if self._persisted is None:
+            await self.insert()
+        else:
+            update = self.get_changes()
+            if not update:
+                return
+            await self.manager.get_collection().update_one({'_id': self.id}, update)
+        self.mark_persisted()
+
 
 class UserModelManager(BaseModelManager[UserModel]):
     """User Model Manager"""
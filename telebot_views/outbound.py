@@ -0,0 +1,299 @@
+import asyncio
+import inspect
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from logging import getLogger
+from typing import Any, Awaitable, Callable, Iterator, Optional, Union
+
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_helper import ApiTelegramException
+
+logger = getLogger(__name__)
+
+ChatId = Union[int, str, None]
+
+SCHEDULED_PREFIXES = ('send_', 'edit_', 'delete_', 'forward_', 'copy_', 'answer_')
+
+
+class Priority(IntEnum):
+    """Lanes of outgoing requests, lower goes first"""
+
+    INTERACTIVE = 0
+    DEFAULT = 1
+    REPORTS = 2
+    BULK = 3
+
+
+current_priority: ContextVar[Priority] = ContextVar('outbound_priority', default=Priority.DEFAULT)
+
+
+@contextmanager
+def outbound_priority(priority: Priority) -> Iterator[None]:
+    """Requests made in the block are put into the `priority` lane"""
+    token = current_priority.set(priority)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+class TokenBucket:
+    """Token bucket with `rate` tokens per second and a burst of `capacity`"""
+
+    def __init__(self, rate: float, capacity: float, now: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.paused_until = 0.0
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available"""
+        if now < self.paused_until:
+            self.updated = now
+            return self.paused_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def pause(self, until: float) -> None:
+        """No tokens until `until`, then a single one"""
+        self.paused_until = max(self.paused_until, until)
+        self.tokens = 1
+
+    def is_idle(self, now: float) -> bool:
+        return self.delay(now) == 0 and self.tokens >= self.capacity
+
+
+class _Job:
+    __slots__ = ('chat_id', 'call', 'future', 'enqueued', 'retries', 'priority')
+
+    def __init__(self, chat_id: ChatId, call: Callable[[], Awaitable[Any]], priority: Priority, now: float) -> None:
+        self.chat_id = chat_id
+        self.call = call
+        self.priority = priority
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.enqueued = now
+        self.retries = 0
+
+
+class OutboundScheduler:
+    """Scheduler of outgoing Telegram API requests.
+
+    Requests are queued in priority lanes and started when both the global token bucket
+    and the bucket of the chat have a token. Private chats and groups have different limits.
+    Requests of the same chat and lane are started in order.
+    On 429 the chat (or the whole bot if the request has no chat) is paused for `retry_after`
+    and the request is put back to the head of its lane.
+
+    Limits are per process, divide `global_rate` by the number of shards.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+        self,
+        global_rate: float = 30,
+        chat_rate: float = 1,
+        chat_burst: float = 3,
+        group_rate: float = 20 / 60,
+        group_burst: float = 3,
+        max_retries: int = 3,
+    ) -> None:
+        # pylint: disable=too-many-arguments
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_retries = max_retries
+        self._lanes: dict[Priority, OrderedDict[ChatId, deque[_Job]]] = {p: OrderedDict() for p in Priority}
+        self._buckets: dict[ChatId, TokenBucket] = {}
+        self._global: Optional[TokenBucket] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running: set[asyncio.Task] = set()
+        self.sent = 0
+        self.retried = 0
+        self.throttled = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def metrics(self) -> dict[str, Any]:
+        return {
+            'queue_depth': {p.name.lower(): sum(len(q) for q in self._lanes[p].values()) for p in Priority},
+            'in_flight': len(self._running),
+            'sent': self.sent,
+            'retried': self.retried,
+            'throttled': self.throttled,
+            'wait_avg': self.wait_total / self.sent if self.sent else 0.0,
+            'wait_max': self.wait_max,
+        }
+
+    async def call(
+        self, chat_id: ChatId, call: Callable[[], Awaitable[Any]], priority: Optional[Priority] = None
+    ) -> Any:
+        loop = asyncio.get_running_loop()
+        if self._loop is None:
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._global = TokenBucket(self.global_rate, self.global_rate, loop.time())
+        elif self._loop is not loop:
+            # E.g. reports sent with `run_until_complete` outside of the bot loop
+            return await call()
+
+        job = _Job(chat_id, call, current_priority.get() if priority is None else priority, loop.time())
+        self._enqueue(job)
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._dispatch())
+        return await job.future
+
+    def _enqueue(self, job: _Job, head: bool = False) -> None:
+        lane = self._lanes[job.priority]
+        queue = lane.get(job.chat_id)
+        if queue is None:
+            queue = lane[job.chat_id] = deque()
+        if head:
+            queue.appendleft(job)
+        else:
+            queue.append(job)
+        self._wakeup.set()
+
+    def _bucket(self, chat_id: ChatId, now: float) -> Optional[TokenBucket]:
+        if chat_id is None:
+            return None
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst, now)
+            else:
+                bucket = TokenBucket(self.group_rate, self.group_burst, now)
+            self._buckets[chat_id] = bucket
+        return bucket
+
+    def _next_job(self, now: float) -> tuple[Optional[_Job], float]:
+        """First job of the highest lane whose chat is ready, or the delay until one may be ready"""
+        delay = float('inf')
+        for lane in self._lanes.values():
+            for chat_id, queue in list(lane.items()):
+                while queue and queue[0].future.done():
+                    queue.popleft()  # The caller was cancelled, the request is not sent
+                if not queue:
+                    del lane[chat_id]
+                    continue
+                bucket = self._bucket(chat_id, now)
+                chat_delay = bucket.delay(now) if bucket else 0.0
+                if chat_delay == 0:
+                    job = queue.popleft()
+                    if not queue:
+                        del lane[chat_id]
+                    if bucket:
+                        bucket.take()
+                    return job, 0.0
+                delay = min(delay, chat_delay)
+        return None, delay
+
+    async def _dispatch(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if not any(self._lanes.values()):
+                self._wakeup.clear()
+                self._prune(now)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), 60)
+                except asyncio.TimeoutError:
+                    if not any(self._lanes.values()):
+                        return
+                continue
+
+            global_delay = self._global.delay(now)
+            if global_delay > 0:
+                await asyncio.sleep(global_delay)
+                continue
+
+            job, delay = self._next_job(now)
+            if job is None:
+                # Every queued chat is throttled, a new job may be for another chat
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._global.take()
+            wait = now - job.enqueued
+            self.sent += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            task = loop.create_task(self._run(job))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, job: _Job) -> None:
+        if job.future.done():
+            return
+        try:
+            result = await job.call()
+        except ApiTelegramException as err:
+            if err.error_code != 429 or job.retries >= self.max_retries:
+                if not job.future.done():
+                    job.future.set_exception(err)
+                return
+            retry_after = float((err.result_json or {}).get('parameters', {}).get('retry_after', 1))
+            now = asyncio.get_running_loop().time()
+            self.throttled += 1
+            self.retried += 1
+            logger.warning('Too many requests to chat %s, retry after %ss', job.chat_id, retry_after)
+            bucket = self._bucket(job.chat_id, now) or self._global
+            bucket.pause(now + retry_after)
+            job.retries += 1
+            self._enqueue(job, head=True)
+        except BaseException as err:  # pylint: disable=broad-except
+            if not job.future.done():
+                job.future.set_exception(err)
+        else:
+            if not job.future.done():
+                job.future.set_result(result)
+
+    def _prune(self, now: float) -> None:
+        for chat_id in [chat_id for chat_id, bucket in self._buckets.items() if bucket.is_idle(now)]:
+            del self._buckets[chat_id]
+
+
+class ScheduledBot:
+    """Proxy of `AsyncTeleBot` which sends requests through the outbound scheduler.
+
+    Methods that send, edit, delete or answer are scheduled, others are called directly.
+    """
+
+    def __init__(self, tele_bot: AsyncTeleBot, scheduler: OutboundScheduler) -> None:
+        self.bot = tele_bot
+        self.scheduler = scheduler
+        self._signatures: dict[str, inspect.Signature] = {}
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self.bot, name)
+        if not name.startswith(SCHEDULED_PREFIXES) or not inspect.iscoroutinefunction(attr):
+            return attr
+
+        async def scheduled(*args: Any, **kwargs: Any) -> Any:
+            chat_id = self._get_chat_id(name, attr, args, kwargs)
+            return await self.scheduler.call(chat_id, lambda: attr(*args, **kwargs))
+
+        return scheduled
+
+    def _get_chat_id(self, name: str, method: Callable, args: tuple, kwargs: dict[str, Any]) -> ChatId:
+        if name not in self._signatures:
+            self._signatures[name] = inspect.signature(method)
+        try:
+            return self._signatures[name].bind_partial(*args, **kwargs).arguments.get('chat_id')
+        except TypeError:
+            return None
@@ -0,0 +1,72 @@
+import asyncio
+from logging import getLogger
+from typing import Awaitable, Callable, Optional
+
+logger = getLogger(__name__)
+
+Job = Callable[[], Awaitable[None]]
+
+
+class _Mailbox:
+    def __init__(self, size: int) -> None:
+        self.queue: asyncio.Queue[Job] = asyncio.Queue(size)
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+
+class UpdateScheduler:
+    """Per-user update scheduler.
+
+    Every incoming update is put into the mailbox of its user.
+    A mailbox is drained by a single worker, so updates of the same user are processed
+    strictly in order, while different users are processed in parallel.
+    A worker exits when its mailbox stays empty for `idle_timeout` seconds.
+    A full mailbox makes the caller wait.
+    """
+
+    def __init__(self, mailbox_size: int = 100, idle_timeout: float = 60, concurrency: int = 256) -> None:
+        self.mailbox_size = mailbox_size
+        self.idle_timeout = idle_timeout
+        self.concurrency = concurrency
+        self._mailboxes: dict[int, _Mailbox] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def __len__(self) -> int:
+        return len(self._mailboxes)
+
+    async def submit(self, user_id: int, job: Job) -> None:
+        mailbox = self._mailboxes.get(user_id)
+        if mailbox is None:
+            mailbox = self._mailboxes[user_id] = _Mailbox(self.mailbox_size)
+            mailbox.task = asyncio.create_task(self._worker(user_id, mailbox))
+
+        if mailbox.queue.full():
+            logger.warning('Mailbox of user %s is full. Waiting...', user_id)
+        await mailbox.queue.put(job)
+        mailbox.wakeup.set()
+
+    async def _worker(self, user_id: int, mailbox: _Mailbox) -> None:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        try:
+            while True:
+                if mailbox.queue.empty():
+                    mailbox.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(mailbox.wakeup.wait(), self.idle_timeout)
+                    except asyncio.TimeoutError:
+                        if mailbox.queue.empty():
+                            break
+                    continue
+
+                job = mailbox.queue.get_nowait()
+                async with self._semaphore:
+                    try:
+                        await job()
+                    except Exception:  # pylint: disable=broad-except
+                        # Jobs report their errors themselves
+                        logger.debug('Update of user %s failed', user_id, exc_info=True)
+        finally:
+            if self._mailboxes.get(user_id) is mailbox:
+                del self._mailboxes[user_id]
+            logger.debug('Mailbox of user %s evicted', user_id)
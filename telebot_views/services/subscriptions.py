@@ -4,6 +4,7 @@ from telebot.asyncio_helper import ApiTelegramException
 from telebot.types import ChatMemberAdministrator, ChatMemberMember, ChatMemberOwner, ChatMemberRestricted
 
 from telebot_views import bot
+from telebot_views.decorators.cache import async_ttl_cache
 from telebot_views.models.cache import with_cache
 from telebot_views.services.chats import get_chat
 
@@ -33,17 +34,18 @@ async def check_subscription(chat_id: int, user_id: int) -> bool:
     return result
 
 
-async def ensure_subscription(chat_id: int, user_id: int, force: bool = False) -> bool:
-    """Проверяет подписку пользователя на канал в кэше.
-    Если валидный кэш отсутствует, то записывает результат в кэш.
+async def load_subscription(chat_id: int, user_id: int, force: bool = False) -> dict:
+    """Результат проверки подписки из кэша, `force` обновляет кэш"""
 
-    Если подписки нет, то отправляет уведомление с необходимостью подписаться на канал.
-    """
-
-    cache_key = f'chat:{chat_id}:user:{user_id}:sub'
-
-    @with_cache(cache_key, 60 * 5, force=force)
-    async def _inner() -> dict[str, bool]:
+    @with_cache(
+        f'chat:{chat_id}:user:{user_id}:sub',
+        60 * 5,
+        force=force,
+        stale_ttl=60 * 10,
+        negative_ttl=60,
+        is_negative=lambda result: not result['subscription_result'],
+    )
+    async def _inner() -> dict:
         subscription_result = await check_subscription(chat_id, user_id)
         result = {'subscription_result': subscription_result}
         if not subscription_result:
@@ -52,7 +54,28 @@ async def ensure_subscription(chat_id: int, user_id: int, force: bool = False) -
             result['chat_username'] = chat.username
         return result
 
-    data = await _inner()
+    return await _inner()
+
+
+@async_ttl_cache(ttl=10, maxsize=4096)
+async def get_subscription(chat_id: int, user_id: int) -> dict:
+    """Результат проверки подписки из кэша процесса"""
+    return await load_subscription(chat_id, user_id)
+
+
+async def ensure_subscription(chat_id: int, user_id: int, force: bool = False) -> bool:
+    """Проверяет подписку пользователя на канал в кэше.
+    Если валидный кэш отсутствует, то записывает результат в кэш.
+
+    Если подписки нет, то отправляет уведомление с необходимостью подписаться на канал.
+    """
+
+    if force:
+        # Не присоединяется к текущему вызову без `force`
+        get_subscription.invalidate(chat_id, user_id)
+        data = await load_subscription(chat_id, user_id, force=True)
+    else:
+        data = await get_subscription(chat_id, user_id)
 
     if not data['subscription_result']:
         chat_title = data['chat_title']
@@ -1,3 +1,5 @@
+from collections import OrderedDict
+from time import monotonic
 from typing import Optional
 
 from telebot.types import CallbackQuery, InlineQuery, Message
@@ -5,27 +7,95 @@ from telebot.types import CallbackQuery, InlineQuery, Message
 from telebot_views.models import UserModel, get_user_model
 
 
+class UserIdentityMap:
+    """In-process identity map of users.
+
+    Keeps loaded users for `ttl` seconds, so an update does not read its user from Mongo.
+    Only safe when updates of a user are handled by a single process, see `nodes` in `init()`.
+    """
+
+    def __init__(self, ttl: float = 60, maxsize: int = 10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._users: OrderedDict[int, tuple[float, UserModel]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def get(self, user_id: int) -> Optional[UserModel]:
+        item = self._users.get(user_id)
+        if item is None:
+            return None
+        expires_at, user = item
+        if expires_at < monotonic() or not isinstance(user, get_user_model()):
+            del self._users[user_id]
+            return None
+        self._users.move_to_end(user_id)
+        return user
+
+    def put(self, user: UserModel) -> None:
+        if self.ttl <= 0:
+            return
+        self._users[user.user_id] = (monotonic() + self.ttl, user)
+        self._users.move_to_end(user.user_id)
+        while len(self._users) > self.maxsize:
+            self._users.popitem(last=False)
+
+    def evict(self, user_id: int) -> None:
+        self._users.pop(user_id, None)
+
+    def configure(self, ttl: float, maxsize: Optional[int] = None) -> None:
+        self.ttl = ttl
+        if maxsize is not None:
+            self.maxsize = maxsize
+        if ttl <= 0:
+            self._users.clear()
+
+
+# Disabled until `init()` enables it, see `user_cache_ttl`
+user_identity_map = UserIdentityMap(ttl=0)
+
+
 async def get_user_for_message(
     msg: Message | CallbackQuery | InlineQuery, available: Optional[bool] = None
 ) -> UserModel:
-    to_insert = False
+    """Returns the user of the update, inserted or updated right away"""
+    user = await load_user_for_message(msg, available)
+    await save_user(user)
+    return user
+
+
+async def load_user_for_message(
+    msg: Message | CallbackQuery | InlineQuery, available: Optional[bool] = None
+) -> UserModel:
+    """Returns the user of the update without saving it.
+    Changes are persisted with `save_user` at the end of the update by `ViewDispatcher`.
+    """
+
     model = get_user_model()
-    user = await model.manager({'user_id': msg.from_user.id}).find_one(raise_exception=False)
+    user = user_identity_map.get(msg.from_user.id)
 
     if user is None:
-        to_insert = True
-        user = model()
-
-    user.user_id = msg.from_user.id
-    user.username = msg.from_user.username or ''
-    user.first_name = msg.from_user.first_name or ''
-    user.last_name = msg.from_user.last_name or ''
+        user = await model.manager({'user_id': msg.from_user.id}).find_one(raise_exception=False)
+        if user is None:
+            user = model(user_id=msg.from_user.id)
+        else:
+            user.mark_persisted()
 
+    profile = {
+        'username': msg.from_user.username or '',
+        'first_name': msg.from_user.first_name or '',
+        'last_name': msg.from_user.last_name or '',
+    }
     if available is not None:
-        user.is_available = available
+        profile['is_available'] = available
+    for name, value in profile.items():
+        if getattr(user, name) != value:
+            setattr(user, name, value)
 
-    if to_insert:
-        await user.insert()
-    else:
-        await user.update()
+    user_identity_map.put(user)
     return user
+
+
+async def save_user(user: UserModel) -> None:
+    await user.save()
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import multiprocessing
+import os
+from logging import getLogger
+from multiprocessing.context import BaseContext
+from multiprocessing.process import BaseProcess
+from multiprocessing.queues import Queue
+from typing import Any, Callable, Optional
+
+from telebot import asyncio_helper
+from telebot.async_telebot import AsyncTeleBot
+from telebot.types import Update
+
+logger = getLogger(__name__)
+
+Setup = Callable[[], AsyncTeleBot]
+
+USER_FIELDS = (
+    'message',
+    'edited_message',
+    'callback_query',
+    'inline_query',
+    'chosen_inline_result',
+    'shipping_query',
+    'pre_checkout_query',
+    'poll_answer',
+    'my_chat_member',
+    'chat_member',
+    'chat_join_request',
+)
+
+
+def get_update_user_id(update: dict[str, Any]) -> Optional[int]:
+    for field in USER_FIELDS:
+        if field in update:
+            user = update[field].get('from') or update[field].get('user') or {}
+            return user.get('id')
+    return None
+
+
+class ShardedPolling:
+    """Supervisor for multi-process update processing.
+
+    The supervisor pulls updates from Telegram once and hashes `from_user.id`
+    to one of the worker processes. Every worker calls `setup` to build its bot
+    and `init()` the views, then processes its share of updates with the usual `ViewDispatcher`.
+    State and locks of a user always live on one shard, so workers can use `LockMode.LOCAL`.
+
+    A dead worker is restarted before updates are put to its shard, updates queued to it are lost.
+    Polling stops with an error if a worker dies more than `max_restarts` times, e.g. if `setup` fails.
+
+    `setup` must be picklable, e.g. a module level function.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+        self,
+        token: str,
+        setup: Setup,
+        workers: int = os.cpu_count() or 1,
+        timeout: int = 20,
+        allowed_updates: Optional[list[str]] = None,
+        mp_context: Optional[BaseContext] = None,
+        max_restarts: int = 3,
+    ):
+        # pylint: disable=too-many-arguments
+        self.token = token
+        self.setup = setup
+        self.workers = workers
+        self.timeout = timeout
+        self.allowed_updates = allowed_updates
+        self.max_restarts = max_restarts
+        self._context = mp_context or multiprocessing.get_context('spawn')
+        self._queues: list[Queue] = []
+        self._processes: list[BaseProcess] = []
+        self._restarts: list[int] = []
+
+    def shard_for(self, update: dict[str, Any]) -> int:
+        return (get_update_user_id(update) or 0) % self.workers
+
+    def start(self) -> None:
+        self._queues = [self._context.Queue() for _ in range(self.workers)]
+        self._processes = [self._start_worker(shard) for shard in range(self.workers)]
+        self._restarts = [0] * self.workers
+        logger.info('Started %s shards', self.workers)
+
+    def _start_worker(self, shard: int) -> BaseProcess:
+        process = self._context.Process(
+            target=run_worker,
+            args=(self.setup, self._queues[shard]),
+            name=f'telebot_views-shard-{shard}',
+            daemon=True,
+        )
+        process.start()
+        return process
+
+    def ensure_worker(self, shard: int) -> None:
+        """Restarts the worker of the shard if it died"""
+        process = self._processes[shard]
+        if process.is_alive():
+            return
+        if self._restarts[shard] >= self.max_restarts:
+            raise RuntimeError(f'Shard {shard} died {self._restarts[shard] + 1} times, exit code {process.exitcode}')
+        self._restarts[shard] += 1
+        logger.error('Shard %s died with exit code %s, restarting', shard, process.exitcode)
+        # The dead worker may hold the read lock of its queue
+        self._queues[shard] = self._context.Queue()
+        self._processes[shard] = self._start_worker(shard)
+
+    def dispatch(self, updates: list[dict[str, Any]]) -> None:
+        batches: dict[int, list[dict[str, Any]]] = {}
+        for update in updates:
+            batches.setdefault(self.shard_for(update), []).append(update)
+        for shard, batch in batches.items():
+            self.ensure_worker(shard)
+            self._queues[shard].put(json.dumps(batch))
+
+    def stop(self, timeout: float = 10) -> None:
+        for queue in self._queues:
+            queue.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._queues.clear()
+        self._processes.clear()
+        self._restarts.clear()
+        logger.info('Shards stopped')
+
+    async def poll(self) -> None:
+        offset = None
+        while True:
+            try:
+                updates = await asyncio_helper.get_updates(
+                    self.token,
+                    offset=offset,
+                    timeout=self.timeout,
+                    allowed_updates=self.allowed_updates,
+                    request_timeout=self.timeout + 10,
+                )
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('Polling error')
+                await asyncio.sleep(3)
+                continue
+            if updates:
+                offset = updates[-1]['update_id'] + 1
+                self.dispatch(updates)
+
+    def run(self) -> None:
+        self.start()
+        try:
+            asyncio.run(self.poll())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+
+def run_worker(setup: Setup, queue: Queue) -> None:
+    tele_bot = setup()
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(process_shard(tele_bot, queue))
+
+
+async def process_shard(tele_bot: AsyncTeleBot, queue: Queue) -> None:
+    loop = asyncio.get_running_loop()
+    tasks: set[asyncio.Task] = set()
+    while True:
+        data = await loop.run_in_executor(None, queue.get)
+        if data is None:
+            break
+        updates = [Update.de_json(update) for update in json.loads(data)]
+        # Handlers are started in order of updates, per-user ordering is kept by locks or the update scheduler
+        task = asyncio.create_task(tele_bot.process_new_updates(updates))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.wait(tasks)
@@ -0,0 +1,115 @@
+import json
+from typing import Any, Optional
+from weakref import WeakSet
+
+from telebot_models.models import BaseModelManager
+
+from telebot_views.lru import TTLCache
+
+Filters = Optional[dict[str, Any]]
+
+
+class Total(int):
+    """Number of documents, `capped` if counting stopped at this number"""
+
+    capped: bool
+
+    def __new__(cls, value: int, capped: bool = False) -> 'Total':
+        total = super().__new__(cls, value)
+        total.capped = capped
+        return total
+
+    def __str__(self) -> str:
+        return f'{int(self)}+' if self.capped else str(int(self))
+
+
+class TotalProvider:
+    """Counts documents for `Paginator.paginate`.
+
+    `manager` is already filtered with `filters`, providers may count with either of them.
+    `offset` is the number of documents before the requested page.
+    """
+
+    async def get_total(self, manager: BaseModelManager, filters: Filters = None, offset: int = 0) -> Total:
+        raise NotImplementedError
+
+    def get_filters(self, manager: BaseModelManager, filters: Filters = None) -> dict[str, Any]:
+        """Given filters, or the filters of the manager if they are not given"""
+        if filters is not None:
+            return filters
+        manager_filters = getattr(manager, 'filters', None)
+        if manager_filters is None:
+            raise ValueError(f'{type(self).__name__} counts with collection queries, pass `filters` of the manager')
+        return manager_filters
+
+
+class ExactTotal(TotalProvider):
+    """Counts documents on every call"""
+
+    async def get_total(self, manager: BaseModelManager, filters: Filters = None, offset: int = 0) -> Total:
+        return Total(await manager.count())
+
+
+_cached_totals: WeakSet['CachedExactTotal'] = WeakSet()
+
+
+class CachedExactTotal(TotalProvider):
+    """Counts documents once per collection and filters for `ttl` seconds.
+
+    Call `invalidate_totals` after inserts or deletes to show the new total before the TTL.
+    """
+
+    def __init__(self, ttl: float = 60, maxsize: int = 1024):
+        self._cache: TTLCache[tuple[str, str], Total] = TTLCache(maxsize, ttl)
+        _cached_totals.add(self)
+
+    async def get_total(self, manager: BaseModelManager, filters: Filters = None, offset: int = 0) -> Total:
+        filters = self.get_filters(manager, filters)
+        key = manager.collection, json.dumps(filters, sort_keys=True, default=str)
+        total = self._cache.get(key)
+        if total is None:
+            total = Total(await manager.get_collection().count_documents(filters))
+            self._cache.set(key, total)
+        return total
+
+    def invalidate(self, collection: Optional[str] = None) -> None:
+        if collection is None:
+            self._cache.clear()
+            return
+        for key in [key for key in self._cache.keys() if key[0] == collection]:
+            self._cache.pop(key)
+
+
+def invalidate_totals(collection: Optional[str] = None) -> None:
+    """Drops cached totals of the collection, or of all collections"""
+    for provider in list(_cached_totals):
+        provider.invalidate(collection)
+
+
+class EstimatedTotal(TotalProvider):
+    """Takes the total from collection metadata. Filtered counts fall back to an exact count."""
+
+    async def get_total(self, manager: BaseModelManager, filters: Filters = None, offset: int = 0) -> Total:
+        collection = manager.get_collection()
+        filters = self.get_filters(manager, filters)
+        if filters:
+            return Total(await collection.count_documents(filters))
+        return Total(await collection.estimated_document_count())
+
+
+class CappedTotal(TotalProvider):
+    """Counts up to `cap` documents after the requested page offset, the pagination shows `<pages>+` then.
+
+    Every following page is reachable: the total grows by `cap` as pages further on are opened.
+    """
+
+    def __init__(self, cap: int = 1000):
+        self.cap = cap
+
+    async def get_total(self, manager: BaseModelManager, filters: Filters = None, offset: int = 0) -> Total:
+        filters = self.get_filters(manager, filters)
+        total = await manager.get_collection().count_documents(filters, skip=offset, limit=self.cap)
+        if not total and offset:
+            # The page is past the end, the exact total is less than the offset
+            return Total(await manager.get_collection().count_documents(filters, limit=offset))
+        return Total(offset + total, capped=total >= self.cap)
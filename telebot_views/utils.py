@@ -1,5 +1,74 @@
+import hashlib
+import secrets
+import string
 from datetime import datetime, timezone
+from typing import Any
+
+BASE62_ALPHABET = string.digits + string.ascii_letters
 
 
 def now_utc() -> datetime:
     return datetime.now(tz=timezone.utc)
+
+
+def to_base62(number: int) -> str:
+    result = ''
+    while True:
+        number, rest = divmod(number, 62)
+        result = BASE62_ALPHABET[rest] + result
+        if not number:
+            return result
+
+
+def random_base62(length: int = 8) -> str:
+    return ''.join(secrets.choice(BASE62_ALPHABET) for _ in range(length))
+
+
+def content_hash(*parts: str) -> str:
+    """Short stable hash of strings, e.g. for fingerprints stored in Mongo"""
+    digest = hashlib.blake2b(digest_size=8)
+    for part in parts:
+        digest.update(part.encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def is_safe_path(key: Any) -> bool:
+    return isinstance(key, str) and bool(key) and '.' not in key and not key.startswith('$')
+
+
+def diff_document(old: dict[str, Any], new: dict[str, Any], prefix: str = '') -> tuple[dict[str, Any], dict[str, Any]]:
+    """Returns `$set` and `$unset` parts of a minimal Mongo update from `old` to `new`.
+
+    Nested dicts are compared key by key and updated with dotted paths, unless some keys cannot be used in a path.
+    A dict without nested dicts is replaced whole if that takes fewer operations than its keys.
+    Dicts of dicts, e.g. `state.callbacks`, are always updated by paths, so changed entries are set one by one.
+    """
+    to_set: dict[str, Any] = {}
+    to_unset: dict[str, Any] = {}
+    for key, value in new.items():
+        path = f'{prefix}{key}'
+        if key not in old:
+            to_set[path] = value
+        elif old[key] == value:
+            continue
+        elif (
+            isinstance(value, dict)
+            and isinstance(old[key], dict)
+            and value
+            and all(is_safe_path(k) for k in value)
+            and all(is_safe_path(k) for k in old[key])
+        ):
+            nested_set, nested_unset = diff_document(old[key], value, f'{path}.')
+            is_leaf = not any(isinstance(v, dict) for v in value.values())
+            if is_leaf and len(nested_set) + len(nested_unset) > len(value):
+                to_set[path] = value
+            else:
+                to_set.update(nested_set)
+                to_unset.update(nested_unset)
+        else:
+            to_set[path] = value
+    for key in old:
+        if key not in new:
+            to_unset[f'{prefix}{key}'] = ''
+    return to_set, to_unset
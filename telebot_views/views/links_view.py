@@ -3,7 +3,7 @@ from typing import Optional
 from telebot_models.models import PyObjectId
 
 from telebot_views import RouteResolver
-from telebot_views.base import BaseView
+from telebot_views.base import BaseView, Route
 from telebot_views.dummy import DummyMessageSender
 from telebot_views.models import UserStateCb
 from telebot_views.models.links import LinkModel
@@ -12,6 +12,12 @@ from telebot_views.models.links import LinkModel
 class LinksRouteResolver(RouteResolver):
     """Route resolver to handle commands starting with /start link_<link_id>"""
 
+    deep_link_prefixes = ('/start link_',)
+
+    @classmethod
+    def is_static(cls, route: Route) -> bool:  # pylint: disable=unused-argument
+        return True
+
     async def resolve(self) -> bool:
         link_id_is_valid = False
         if self.request.message.text.startswith('/start link_'):
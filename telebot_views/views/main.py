@@ -1,6 +1,4 @@
-from telebot.types import InlineKeyboardButton
-
-from telebot_views.base import BaseMessageSender, BaseView, RouteResolver
+from telebot_views.base import BaseMessageSender, BaseView, Route, RouteResolver, StaticButton
 from telebot_views.services.subscriptions import ensure_subscription
 
 
@@ -8,6 +6,12 @@ class MainRouteResolver(RouteResolver):
     """Main Route Resolver"""
 
     view: "MainView"
+    commands = ('/start',)
+
+    @classmethod
+    def is_static(cls, route: Route) -> bool:
+        # The subscription is checked for every request
+        return not route.view.ensure_subscription_chat_id
 
     async def resolve(self) -> bool:
         if self.view.ensure_subscription_chat_id:
@@ -19,19 +23,12 @@ class MainRouteResolver(RouteResolver):
             if not subscribed:
                 return True
 
-        return self.request.message.text == '/start' or await super().resolve()
+        return await super().resolve()
 
 
 class MainMessageSender(BaseMessageSender):
     """Main Message Sender"""
 
-    async def get_keyboard(self) -> list[list[InlineKeyboardButton]]:
-        # cb = UserStateCb
-        r = self.view.route_resolver.routes_registry
-        return [
-            [await self.view.buttons.view_btn(r['CHECK_SUB_VIEW'], 1)],
-        ]
-
     async def get_keyboard_text(self) -> str:
         return self.view.labels[0]
 
@@ -48,5 +45,8 @@ class MainView(BaseView):
 
     route_resolver = MainRouteResolver
     message_sender = MainMessageSender
+    static_keyboard = [
+        [StaticButton('CHECK_SUB_VIEW', 1)],
+    ]
 
     ensure_subscription_chat_id: int = 0